@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+benchmark filter_datum, RedactingFormatter and alternative redaction
+engines on synthetic log records.
+
+usage: ./benchmark_redaction.py [--quick] [--json OUT] [--compare OLD]
+"""
+
+import re
+import sys
+import copy
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tracemalloc
+from itertools import product
+from typing import Callable, Dict, List
+from filtered_logger import (
+    PII_FIELDS,
+    RedactingFormatter,
+    filter_datum,
+    get_redaction_engine
+)
+
+
+FIELD_COUNTS = (5, 20, 80)
+VALUE_LENGTHS = (8, 64, 512)
+SEPARATORS = (";", ",")
+PII_DENSITIES = (0.0, 0.25, 1.0)
+RECORDS_PER_CASE = 256
+MIN_SECONDS = 0.2
+ALLOC_SAMPLES = 200
+
+
+def legacy_filter_datum(fields: List[str], redaction: str,
+                        message: str, separator: str) -> str:
+    """
+    the original one-re.sub-per-field implementation, kept as a baseline.
+    """
+    for field in fields:
+        regex = f"{field}=[^{separator}]*"
+        message = re.sub(regex, f"{field}={redaction}", message)
+    return message
+
+
+def make_records(field_count: int, value_length: int, density: float,
+                 seed: int = 0) -> List[Dict[str, str]]:
+    """
+    generate synthetic records as ordered key/value mappings.
+    Args:
+        field_count (int): Number of fields per record.
+        value_length (int): Length of every value.
+        density (float): Fraction of the fields that are PII fields.
+        seed (int): Seed of the random generator.
+    Returns:
+        List[Dict[str, str]]: RECORDS_PER_CASE records.
+    """
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789@.-"
+    records = []
+    for _ in range(RECORDS_PER_CASE):
+        record = {}
+        for i in range(field_count):
+            if rng.random() < density:
+                key = PII_FIELDS[i % len(PII_FIELDS)]
+                key = key if key not in record else f"{key}_{i}"
+                key = key if key not in record else f"x_{key}"
+            else:
+                key = f"field_{i}"
+            record[key] = "".join(rng.choice(alphabet)
+                                  for _ in range(value_length))
+        records.append(record)
+    return records
+
+
+def render(record: Dict[str, str], separator: str) -> str:
+    """
+    render a record the way it would appear in a log line.
+    """
+    return separator.join(f"{k}={v}" for k, v in record.items()) + separator
+
+
+def _log_record(msg) -> logging.LogRecord:
+    """
+    build a log record carrying msg.
+    """
+    return logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                             msg, None, None)
+
+
+def string_engines(separator: str) -> Dict[str, Callable]:
+    """
+    redaction engines operating on rendered messages.
+    """
+    fields = list(PII_FIELDS)
+    redaction = RedactingFormatter.REDACTION
+    engine = get_redaction_engine(fields, separator)
+    engines = {
+        "legacy_loop": lambda m: legacy_filter_datum(fields, redaction,
+                                                     m, separator),
+        "filter_datum": lambda m: filter_datum(fields, redaction,
+                                               m, separator),
+        "compiled_engine": lambda m: engine.redact(m, redaction),
+    }
+    if separator == RedactingFormatter.SEPARATOR:
+        formatter = RedactingFormatter(PII_FIELDS)
+        engines["formatter"] = lambda m: formatter.format(_log_record(m))
+    return engines
+
+
+def mapping_engines() -> Dict[str, Callable]:
+    """
+    redaction engines operating on structured records.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    return {
+        "formatter_structured": lambda r: formatter.format(_log_record(r)),
+        "redact_mapping": formatter.redact_mapping,
+    }
+
+
+PARITY_RECORDS = [
+    {"user_agent": "ua email=leak", "ip": "10.0.0.1"},
+    {"name": "bob;phone=555", "note": "a;b", "password": "x=y"},
+    {"username": "bob", "query": "q=1; ssn=123", "email": ""},
+    {"email=": "k", "a;name": "v", "last_login": None, "count": 3},
+]
+
+
+def check_parity(records: List[Dict[str, str]]) -> List[dict]:
+    """
+    compare the structured path with the redaction of the same record
+    rendered as a string.
+    Returns:
+        List[dict]: The records whose two renderings differ.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    joiner = RedactingFormatter.FIELD_JOINER
+    mismatches = []
+    for data in records:
+        record = _log_record(data)
+        rendered = copy.copy(record)
+        rendered.msg = joiner.join(f"{k}={v}" for k, v in data.items())
+        if formatter.format(record) != formatter.format(rendered):
+            mismatches.append(data)
+    return mismatches
+
+
+def measure(func: Callable, inputs: list, min_seconds: float) -> dict:
+    """
+    time func over inputs until min_seconds have elapsed, then
+    sample the bytes it allocates per call with tracemalloc.
+    Returns:
+        dict: ops, seconds, ops_per_sec and alloc_bytes_per_op.
+    """
+    for item in inputs:
+        func(item)
+    ops = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds:
+        for item in inputs:
+            func(item)
+        ops += len(inputs)
+        elapsed = time.perf_counter() - start
+    samples = inputs[:ALLOC_SAMPLES]
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for item in samples:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func(item)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return {
+        "ops": ops,
+        "seconds": elapsed,
+        "ops_per_sec": ops / elapsed,
+        "alloc_bytes_per_op": allocated / len(samples),
+    }
+
+
+def run(quick: bool = False, min_seconds: float = MIN_SECONDS) -> dict:
+    """
+    run every engine on every synthetic case.
+    Args:
+        quick (bool): Only run the smallest value of every dimension
+            besides PII density.
+        min_seconds (float): Minimum timing duration per measurement.
+    Returns:
+        dict: Environment metadata and one result per (case, engine).
+    """
+    dimensions = (FIELD_COUNTS, VALUE_LENGTHS, SEPARATORS, PII_DENSITIES)
+    if quick:
+        dimensions = tuple(d[:1] for d in dimensions[:3]) + dimensions[3:]
+    results = []
+    for fields, length, separator, density in product(*dimensions):
+        records = make_records(fields, length, density)
+        messages = [render(r, separator) for r in records]
+        case = {
+            "fields": fields,
+            "value_length": length,
+            "separator": separator,
+            "pii_density": density,
+            "message_length": sum(map(len, messages)) // len(messages),
+        }
+        engines = [(name, func, messages)
+                   for name, func in string_engines(separator).items()]
+        engines += [(name, func, records)
+                    for name, func in mapping_engines().items()]
+        for name, func, inputs in engines:
+            result = dict(case, engine=name)
+            result.update(measure(func, inputs, min_seconds))
+            results.append(result)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def _key(result: dict) -> tuple:
+    """
+    identify a result across runs.
+    """
+    return (result["engine"], result["fields"], result["value_length"],
+            result["separator"], result["pii_density"])
+
+
+def compare(current: dict, baseline: dict) -> List[dict]:
+    """
+    compute the speedup of every result also present in baseline.
+    Returns:
+        List[dict]: engine, case and ops_per_sec ratio (>1 is faster).
+    """
+    old = {_key(r): r for r in baseline["results"]}
+    ratios = []
+    for result in current["results"]:
+        previous = old.get(_key(result))
+        if previous is not None:
+            ratios.append({
+                "case": _key(result),
+                "ratio": result["ops_per_sec"] / previous["ops_per_sec"],
+            })
+    return ratios
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--quick", action="store_true",
+                        help="run a reduced set of cases")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS,
+                        help="minimum timing duration per measurement")
+    parser.add_argument("--json", metavar="OUT",
+                        help="write the results as JSON to OUT")
+    parser.add_argument("--compare", metavar="OLD",
+                        help="report speedups against a previous JSON run")
+    args = parser.parse_args(argv)
+    mismatches = check_parity(PARITY_RECORDS + make_records(20, 8, 0.25))
+    if mismatches:
+        sys.exit(f"redact_mapping differs from the string path: "
+                 f"{mismatches[0]}")
+    report = run(args.quick, args.min_seconds)
+    print(f"{'engine':<22}{'fields':>7}{'length':>8}{'sep':>4}"
+          f"{'pii':>6}{'ops/sec':>14}{'B/op':>10}")
+    for r in report["results"]:
+        print(f"{r['engine']:<22}{r['fields']:>7}{r['message_length']:>8}"
+              f"{r['separator']:>4}{r['pii_density']:>6}"
+              f"{r['ops_per_sec']:>14,.0f}{r['alloc_bytes_per_op']:>10,.0f}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(report, baseline)
+        for c in report["comparison"]:
+            print("{}: {:.2f}x".format(" ".join(map(str, c["case"])),
+                                       c["ratio"]), file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,34 @@ provide functionalities for hashing passwords
 and verifying them using bcrypt.
 """
 
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 import bcrypt
 
 
+MAX_WORKERS = os.cpu_count() or 1
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+TARGET_SECONDS = 0.25
+CACHE_SIZE = 10000
+CACHE_TTL = 60.0
+
+_rounds = None
+_verification_cache = None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
 def hash_password(password: str) -> bytes:
     """
     hash a password using bcrypt.
@@ -15,7 +40,8 @@ def hash_password(password: str) -> bytes:
     Returns:
         bytes: The hashed password.
     """
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode("utf-8"),
+                         bcrypt.gensalt(get_rounds()))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
@@ -27,4 +53,336 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     Returns:
         bool: True if the password matches the hashed password.
     """
+    if _verification_cache is not None:
+        return _verification_cache.verify(hashed_password, password,
+                                          _checkpw)
+    return _checkpw(hashed_password, password)
+
+
+def _checkpw(hashed_password: bytes, password: str) -> bool:
+    """
+    run the actual bcrypt verification.
+    """
     return bcrypt.checkpw(password.encode("utf-8"), hashed_password)
+
+
+def get_rounds() -> int:
+    """
+    return the bcrypt cost used for new hashes.
+    it is the value given to set_rounds, else BCRYPT_ROUNDS from the
+    environment, else DEFAULT_ROUNDS.
+    Returns:
+        int: The log2 number of rounds.
+    """
+    if _rounds is not None:
+        return _rounds
+    return int(os.getenv("BCRYPT_ROUNDS", DEFAULT_ROUNDS))
+
+
+def set_rounds(rounds: int = None) -> None:
+    """
+    set the bcrypt cost used for new hashes, None restores the default.
+    Args:
+        rounds (int): The log2 number of rounds.
+    """
+    global _rounds
+    if rounds is not None and not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+        raise ValueError(f"rounds must be in [{MIN_ROUNDS}, {MAX_ROUNDS}]")
+    _rounds = rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    read the cost a bcrypt hash was created with.
+    Args:
+        hashed_password (bytes): A hash such as b"$2b$12$...".
+    Returns:
+        int: The log2 number of rounds.
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def _time_rounds(rounds: int, password: bytes) -> float:
+    """
+    time one verification at the given cost.
+    """
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    start = time.perf_counter()
+    bcrypt.checkpw(password, hashed)
+    return time.perf_counter() - start
+
+
+def calibrate_rounds(target_seconds: float = TARGET_SECONDS,
+                     min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS,
+                     apply: bool = False) -> int:
+    """
+    find the highest cost whose verification stays within target_seconds
+    on this host.
+    each extra round doubles the work, so a cheap measurement is
+    extrapolated and the candidate is then confirmed by timing it.
+    Args:
+        target_seconds (float): Verification latency budget.
+        min_rounds (int): Lowest acceptable cost.
+        max_rounds (int): Highest acceptable cost.
+        apply (bool): Also use the result for new hashes.
+    Returns:
+        int: The calibrated log2 number of rounds.
+    """
+    password = b"calibration-password"
+    probe = max(min_rounds, min(8, max_rounds))
+    elapsed = min(_time_rounds(probe, password) for _ in range(3))
+    rounds = probe
+    while rounds < max_rounds and elapsed * 2 <= target_seconds:
+        rounds += 1
+        elapsed *= 2
+    while rounds > min_rounds and \
+            _time_rounds(rounds, password) > target_seconds:
+        rounds -= 1
+    if apply:
+        set_rounds(rounds)
+    return rounds
+
+
+def verify_and_maybe_rehash(hashed_password: bytes, password: str,
+                            rounds: int = None) -> Tuple[
+                                bool, Optional[bytes]]:
+    """
+    verify a password and rehash it when its cost is outdated.
+    Args:
+        hashed_password (bytes): The stored hash.
+        password (str): The plaintext password to verify.
+        rounds (int): The wanted cost, defaults to get_rounds().
+    Returns:
+        Tuple[bool, Optional[bytes]]: Whether the password is valid and,
+            when it is and the stored cost differs, a new hash to store.
+    """
+    if not is_valid(hashed_password, password):
+        return False, None
+    rounds = get_rounds() if rounds is None else rounds
+    if hash_rounds(hashed_password) == rounds:
+        return True, None
+    return True, bcrypt.hashpw(password.encode("utf-8"),
+                               bcrypt.gensalt(rounds))
+
+
+class VerificationCache:
+    """
+    short-lived cache of successful password verifications.
+    entries are keyed by an HMAC of (stored hash, candidate) under a
+    per-process random key, so neither the plaintext nor anything
+    that can be checked offline against the hash is retained.
+    failed verifications are never cached.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 secret: bytes = None):
+        """
+        initialize an empty cache.
+        Args:
+            max_size (int): Maximum number of entries, oldest evicted first.
+            ttl (float): Seconds an entry stays valid.
+            secret (bytes): HMAC key, random by default.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._secret = secret or os.urandom(32)
+        self._entries = OrderedDict()
+        self._by_hash = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        number of cached entries, expired ones included.
+        """
+        return len(self._entries)
+
+    def _digest(self, *parts: bytes) -> bytes:
+        """
+        keyed digest of the NUL-joined parts.
+        """
+        return hmac.new(self._secret, b"\0".join(parts),
+                        hashlib.sha256).digest()
+
+    @staticmethod
+    def _bytes(value: Union[bytes, str]) -> bytes:
+        """
+        encode str values as UTF-8.
+        """
+        return value.encode("utf-8") if isinstance(value, str) else value
+
+    def verify(self, hashed_password: Union[bytes, str], password: str,
+               check: Callable = _checkpw) -> bool:
+        """
+        verify a password, skipping check when it recently succeeded.
+        Args:
+            hashed_password (Union[bytes, str]): The stored hash.
+            password (str): The plaintext password to verify.
+            check (Callable): The slow verification to cache.
+        Returns:
+            bool: True if the password matches the hashed password.
+        """
+        stored = self._bytes(hashed_password)
+        key = self._digest(stored, self._bytes(password))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return True
+                self._pop(key)
+        if not check(hashed_password, password):
+            return False
+        owner = self._digest(stored)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, owner)
+            self._entries.move_to_end(key)
+            self._by_hash.setdefault(owner, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._pop(next(iter(self._entries)))
+        return True
+
+    def _pop(self, key: bytes) -> None:
+        """
+        drop one entry; the caller holds the lock.
+        """
+        owner = self._entries.pop(key)[1]
+        keys = self._by_hash.get(owner)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_hash[owner]
+
+    def invalidate(self, hashed_password: Union[bytes, str] = None) -> None:
+        """
+        forget the entries of one stored hash, or every entry.
+        Args:
+            hashed_password (Union[bytes, str]): The stored hash whose
+                entries are dropped, None to clear the cache.
+        """
+        with self._lock:
+            if hashed_password is None:
+                self._entries.clear()
+                self._by_hash.clear()
+                return
+            owner = self._digest(self._bytes(hashed_password))
+            for key in self._by_hash.pop(owner, ()):
+                self._entries.pop(key, None)
+
+
+def enable_verification_cache(max_size: int = CACHE_SIZE,
+                              ttl: float = CACHE_TTL) -> VerificationCache:
+    """
+    put a VerificationCache in front of is_valid.
+    Args:
+        max_size (int): Maximum number of entries.
+        ttl (float): Seconds an entry stays valid.
+    Returns:
+        VerificationCache: The installed cache.
+    """
+    global _verification_cache
+    _verification_cache = VerificationCache(max_size, ttl)
+    return _verification_cache
+
+
+def disable_verification_cache() -> None:
+    """
+    stop caching verifications in is_valid.
+    """
+    global _verification_cache
+    _verification_cache = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    return the shared thread pool used for bcrypt work.
+    bcrypt releases the GIL while hashing, so its MAX_WORKERS
+    threads run on separate cores.
+    Returns:
+        ThreadPoolExecutor: The shared executor.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                           thread_name_prefix="bcrypt")
+        return _executor
+
+
+def _call(func: Callable, *args) -> Union[object, Exception]:
+    """
+    call func, returning the exception instead of raising it.
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
+
+def hash_passwords_batch(passwords: Iterable[str]) -> List[
+        Union[bytes, Exception]]:
+    """
+    hash many passwords in parallel.
+    Args:
+        passwords (Iterable[str]): The passwords to be hashed.
+    Returns:
+        List[Union[bytes, Exception]]: The hashed passwords in input
+            order; an item that failed holds its exception instead.
+    """
+    return list(get_executor().map(_call, repeat(hash_password),
+                                   passwords))
+
+
+def verify_batch(pairs: Iterable[Tuple[bytes, str]]) -> List[
+        Union[bool, Exception]]:
+    """
+    verify many (hashed_password, password) pairs in parallel.
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): Hashes and candidates.
+    Returns:
+        List[Union[bool, Exception]]: The verdicts in input order; an
+            item that failed holds its exception instead.
+    """
+    pairs = list(pairs)
+    return list(get_executor().map(_call, repeat(is_valid),
+                                   [h for h, _ in pairs],
+                                   [p for _, p in pairs]))
+
+
+async def hash_password_async(password: str) -> bytes:
+    """
+    hash a password on the shared executor without blocking the loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), hash_password,
+                                      password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """
+    verify a password on the shared executor without blocking the loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), is_valid,
+                                      hashed_password, password)
+
+
+async def hash_passwords_batch_async(passwords: Iterable[str]) -> List[
+        Union[bytes, Exception]]:
+    """
+    awaitable variant of hash_passwords_batch.
+    """
+    return await asyncio.gather(
+        *[hash_password_async(p) for p in passwords],
+        return_exceptions=True)
+
+
+async def verify_batch_async(pairs: Iterable[Tuple[bytes, str]]) -> List[
+        Union[bool, Exception]]:
+    """
+    awaitable variant of verify_batch.
+    """
+    return await asyncio.gather(
+        *[is_valid_async(h, p) for h, p in pairs],
+        return_exceptions=True)
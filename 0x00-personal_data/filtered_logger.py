@@ -6,11 +6,96 @@ from log messages and handle database operations.
 
 import os
 import re
+import copy
+import time
+import queue
+import atexit
+import weakref
 import logging
-from typing import List
+import threading
+import logging.handlers
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Iterator, List, Mapping, Sequence
 import mysql.connector
 
 
+ENGINE_CACHE_SIZE = 128
+EXPORT_BATCH_SIZE = 1000
+EXPORT_QUEUE_DEPTH = 8
+POOL_SIZE = 5
+POOL_TIMEOUT = 30.0
+BULK_SIZE = 512
+
+
+class RedactionEngine:
+    """
+    redact a fixed set of fields from messages in a single scan.
+    the field names and the separator are compiled once into one
+    alternation pattern, so every message is walked only once no
+    matter how many fields are redacted.
+    """
+
+    def __init__(self, fields: Sequence[str], separator: str,
+                 line_bound: bool = False):
+        """
+        compile the redaction pattern.
+        Args:
+            fields (Sequence[str]): Names of the fields to redact.
+            separator (str): The character that separates fields.
+            line_bound (bool): Whether a value also ends at a newline,
+                for text holding one message per line.
+        """
+        self.fields = tuple(fields)
+        self.separator = separator
+        self.line_bound = line_bound
+        if self.fields:
+            names = "|".join(re.escape(field) for field in self.fields)
+            stop = re.escape(separator) + ("\\n" if line_bound else "")
+            self.pattern = re.compile(f"({names})=[^{stop}]*")
+        else:
+            self.pattern = None
+
+    def redact(self, message: str, redaction: str) -> str:
+        """
+        replace the value of every configured field with redaction.
+        Args:
+            message (str): The original message containing field values.
+            redaction (str): The string to replace the field values.
+        Returns:
+            str: The message with field values redacted.
+        """
+        if self.pattern is None or "=" not in message:
+            return message
+        return self.pattern.sub(f"\\g<1>={redaction}", message)
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def _cached_engine(fields: tuple, separator: str,
+                   line_bound: bool) -> RedactionEngine:
+    """
+    build a redaction engine, memoized on (fields, separator, line_bound).
+    """
+    return RedactionEngine(fields, separator, line_bound)
+
+
+def get_redaction_engine(
+    fields: Sequence[str], separator: str, line_bound: bool = False
+) -> RedactionEngine:
+    """
+    return the compiled redaction engine for fields and separator.
+    engines are kept in a bounded LRU cache so callers passing the
+    same configuration share one compiled pattern.
+    Args:
+        fields (Sequence[str]): Names of the fields to redact.
+        separator (str): The character that separates fields.
+        line_bound (bool): Whether a value also ends at a newline.
+    Returns:
+        RedactionEngine: The shared engine for this configuration.
+    """
+    return _cached_engine(tuple(fields), separator, line_bound)
+
+
 def filter_datum(
     fields: List[str], redaction: str, message: str, separator: str
 ) -> str:
@@ -24,21 +109,23 @@ def filter_datum(
     Returns:
         str: The message with field values redacted.
     """
-    for field in fields:
-        regex = f"{field}=[^{separator}]*"
-        message = re.sub(regex, f"{field}={redaction}", message)
-    return message
+    engine = get_redaction_engine(fields, separator)
+    return engine.redact(message, redaction)
 
 
 class RedactingFormatter(logging.Formatter):
     """
     custom logging formatter to redact specified
     sensitive fields from log records.
+    records whose message is a mapping are redacted by key before
+    being rendered as "key=value; ..." instead of being regex-scanned.
     """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
+    FIELD_JOINER = "; "
+    MAX_CACHED_KEYS = 1024
 
     def __init__(self, fields: List[str]):
         """
@@ -48,6 +135,48 @@ class RedactingFormatter(logging.Formatter):
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.engine = get_redaction_engine(fields, self.SEPARATOR)
+        self._redacted_keys = {}
+
+    def is_redacted(self, key: str) -> bool:
+        """
+        tell whether the value of key is redacted.
+        like the regex path, a key is redacted when it ends with one of
+        the fields (so "name" also covers "username").
+        Args:
+            key (str): The key of a structured field.
+        Returns:
+            bool: True if the value of key must be redacted.
+        """
+        redacted = self._redacted_keys.get(key)
+        if redacted is None:
+            redacted = key.endswith(self.engine.fields)
+            if len(self._redacted_keys) < self.MAX_CACHED_KEYS:
+                self._redacted_keys[key] = redacted
+        return redacted
+
+    def redact_mapping(self, data: Mapping) -> str:
+        """
+        render a mapping as "key=value; ..." with sensitive values redacted.
+        the result is the same as redacting the rendered message.
+        Args:
+            data (Mapping): The structured fields of a log message.
+        Returns:
+            str: The rendered and redacted message.
+        """
+        redaction = self.REDACTION
+        separator = self.SEPARATOR
+        parts = []
+        for key, value in data.items():
+            pair = f"{key}={value}"
+            if pair.count("=") > 1 or separator in pair:
+                # embedded "key=value" text or separators: redact the pair
+                # exactly as the rendered message would be
+                pair = self.engine.redact(pair, redaction)
+            elif self.is_redacted(key):
+                pair = f"{key}={redaction}"
+            parts.append(pair)
+        return self.FIELD_JOINER.join(parts)
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -57,32 +186,170 @@ class RedactingFormatter(logging.Formatter):
         Returns:
             str: The formatted and redacted log message.
         """
+        if isinstance(record.msg, Mapping):
+            record = copy.copy(record)
+            record.msg = self.redact_mapping(record.msg)
+            record.args = None
+            return super().format(record)
         original_message = super().format(record)
-        return filter_datum(self.fields, self.REDACTION,
-                            original_message, self.SEPARATOR)
+        return self.engine.redact(original_message, self.REDACTION)
 
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 
-def get_logger() -> logging.Logger:
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    queue handler that enqueues records untouched, leaving formatting
+    and redaction to the listener thread instead of the caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        skip the default eager formatting of QueueHandler.
+        """
+        return record
+
+
+class BulkStreamListener:
+    """
+    drain a queue of log records on a background thread, format them
+    with the handler's formatter and write them to its stream in bulk.
+    """
+
+    def __init__(self, log_queue, handler: logging.StreamHandler,
+                 batch_size: int = BULK_SIZE):
+        """
+        initialize the listener.
+        Args:
+            log_queue: The queue fed by a DeferredQueueHandler.
+            handler (logging.StreamHandler): Provides the formatter and
+                the stream records are written to.
+            batch_size (int): Maximum number of records per write.
+        """
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        start the background thread.
+        """
+        self._thread = threading.Thread(target=self._run,
+                                        name="user_data-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        write out every queued record and stop the background thread.
+        """
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """
+        wait for a record, then take whatever else is already queued.
+        """
+        while True:
+            records = [self.queue.get()]
+            while records[-1] is not None and \
+                    len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = records[-1] is None
+            if done:
+                records.pop()
+            self._write(records)
+            if done:
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        """
+        format a batch of records and write them with a single call.
+        """
+        handler = self.handler
+        lines = []
+        for record in records:
+            if record.levelno < handler.level:
+                continue
+            try:
+                lines.append(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        with handler.lock:
+            try:
+                handler.stream.write("".join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(records[-1])
+
+
+_handler = None
+_listener = None
+_logger_lock = threading.Lock()
+
+
+def _stop_listener() -> None:
+    """
+    stop the buffered listener, if any, flushing pending records.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def get_logger(buffered: bool = None) -> logging.Logger:
     """
     create and configure a logger with a redacting formatter.
+    calling it again returns the same logger without adding handlers;
+    only switching between buffered and direct mode replaces them.
+    Args:
+        buffered (bool): Queue records and let a background listener
+            format, redact and write them in bulk; None keeps the
+            current mode (direct on first call).
     Returns:
         logging.Logger: Configured logger instance.
     """
+    global _handler, _listener
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    with _logger_lock:
+        if _handler in logger.handlers and \
+                buffered in (None, _listener is not None):
+            return logger
+        if buffered is None:
+            buffered = _listener is not None
+        if _handler is not None:
+            logger.removeHandler(_handler)
+        _stop_listener()
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
+        if buffered:
+            log_queue = queue.SimpleQueue()
+            _listener = BulkStreamListener(log_queue, stream_handler)
+            _listener.start()
+            _handler = DeferredQueueHandler(log_queue)
+        else:
+            _handler = stream_handler
+        logger.addHandler(_handler)
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def connect_db() -> mysql.connector.connection.MySQLConnection:
     """
-    establish a connection to the MySQL database.
+    open a new, unpooled connection to the MySQL database.
     Returns:
         mysql.connector.connection.MySQLConnection: db connection instance.
     """
@@ -96,23 +363,362 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     )
 
 
+def is_alive(connection: Any) -> bool:
+    """
+    check that a connection can still talk to its server.
+    Args:
+        connection: A DB-API connection.
+    Returns:
+        bool: True if the connection answered, False otherwise.
+    """
+    try:
+        if hasattr(connection, "is_connected"):
+            return connection.is_connected()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def reset_connection(connection: Any) -> bool:
+    """
+    end the transaction a connection may have left open, so that the
+    next user neither sees its snapshot nor inherits its writes
+    (mysql-connector does not autocommit, so even a SELECT opens one).
+    Args:
+        connection: A DB-API connection.
+    Returns:
+        bool: True if the connection was rolled back, False otherwise.
+    """
+    try:
+        connection.rollback()
+        return True
+    except Exception:
+        return False
+
+
+class PooledConnection:
+    """
+    proxy around a pooled connection: every attribute is delegated
+    to the real connection, except close() which hands it back
+    to the pool it was checked out from. a proxy garbage-collected
+    without being closed hands it back too, so a leak cannot hold
+    a pool slot forever.
+    """
+
+    def __init__(self, pool: "ConnectionPool", connection: Any):
+        """
+        wrap a connection checked out from pool.
+        """
+        self._connection = connection
+        self._release = weakref.finalize(self, pool.release, connection)
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        delegate to the underlying connection.
+        """
+        if self._connection is None:
+            raise AttributeError(f"connection already returned: {name}")
+        return getattr(self._connection, name)
+
+    def __enter__(self) -> "PooledConnection":
+        """
+        use the connection as a context manager.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        return the connection to the pool on exit.
+        """
+        self.close()
+
+    def close(self) -> None:
+        """
+        return the connection to its pool, once.
+        """
+        self._connection = None
+        self._release()
+
+
+class ConnectionPool:
+    """
+    bounded pool of reusable database connections.
+    connections are created lazily by connect, reused LIFO, reset
+    when given back and checked with health_check before being handed
+    out again.
+    """
+
+    def __init__(self, connect: Callable[[], Any] = connect_db,
+                 size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 health_check: Callable[[Any], bool] = is_alive,
+                 reset: Callable[[Any], bool] = reset_connection):
+        """
+        initialize an empty pool.
+        Args:
+            connect (Callable): Factory opening a new connection.
+            size (int): Maximum number of connections checked out at once.
+            timeout (float): Seconds to wait for a free connection.
+            health_check (Callable): Liveness test for idle connections.
+            reset (Callable): Cleanup of released connections, which are
+                closed instead of reused when it returns False.
+        """
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.reset = reset
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """
+        check out a live connection, opening one if none is idle.
+        Args:
+            timeout (float): Seconds to wait, defaults to the pool timeout.
+        Returns:
+            PooledConnection: The connection; close() returns it.
+        Raises:
+            TimeoutError: If every connection stays busy for timeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(
+                f"no database connection available after {timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    connection = self.connect()
+                    break
+                if self.health_check(connection):
+                    break
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+        return PooledConnection(self, connection)
+
+    def release(self, connection: Any) -> None:
+        """
+        give a checked out connection back to the pool, once reset.
+        connections given back to a closed pool are closed.
+        """
+        try:
+            if self.reset(connection):
+                with self._lock:
+                    if not self._closed:
+                        self._idle.append(connection)
+                        return
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator:
+        """
+        check out a connection for the duration of a with block.
+        """
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        finally:
+            pooled.close()
+
+    def close(self) -> None:
+        """
+        close every idle connection, and the checked out ones as
+        they are given back.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._discard(connection)
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        """
+        close a connection, ignoring errors from dead ones.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    return the process-wide connection pool, creating it on first use.
+    its size and checkout timeout are read from
+    PERSONAL_DATA_DB_POOL_SIZE and PERSONAL_DATA_DB_POOL_TIMEOUT.
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", POOL_SIZE)),
+                timeout=float(os.getenv("PERSONAL_DATA_DB_POOL_TIMEOUT",
+                                        POOL_TIMEOUT)))
+        return _pool
+
+
+def set_pool(pool: ConnectionPool = None) -> ConnectionPool:
+    """
+    replace the shared connection pool, e.g. with one backed by sqlite3.
+    the previous pool's idle connections are closed, and the ones
+    still checked out from it once they are given back.
+    Args:
+        pool (ConnectionPool): The new pool, or None to reset.
+    Returns:
+        ConnectionPool: The previous pool, if any.
+    """
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    if previous is not None:
+        previous.close()
+    return previous
+
+
+def get_db() -> PooledConnection:
+    """
+    check out a connection to the MySQL database from the shared pool.
+    closing it returns it to the pool instead of disconnecting.
+    Returns:
+        PooledConnection: proxy of a MySQLConnection instance.
+    """
+    return get_pool().acquire()
+
+
+def fetch_batches(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator:
+    """
+    stream the rows of an executed cursor in fixed-size batches.
+    Args:
+        cursor: A DB-API cursor with a pending result set.
+        batch_size (int): Maximum number of rows per batch.
+    Yields:
+        list: The next batch of rows, until the result set is exhausted.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def export_users(database=None, logger: logging.Logger = None,
+                 batch_size: int = EXPORT_BATCH_SIZE,
+                 queue_depth: int = EXPORT_QUEUE_DEPTH) -> dict:
+    """
+    stream every row of the users table through the redacting logger.
+    rows are fetched in batches on the calling thread (the connection
+    never leaves it) and handed through a bounded queue to a worker
+    thread that logs them as structured records, so a RedactingFormatter
+    redacts them by column name.
+    Args:
+        database: An open DB-API connection, defaults to get_db().
+        logger (logging.Logger): Destination logger, defaults to
+            get_logger().
+        batch_size (int): Number of rows fetched per round trip.
+        queue_depth (int): Number of batches buffered between stages.
+    Returns:
+        dict: rows, batches, seconds and rows_per_sec of the export.
+    """
+    owns_database = database is None
+    if owns_database:
+        database = get_db()
+    if logger is None:
+        logger = get_logger()
+    batches = queue.Queue(maxsize=queue_depth)
+    failure = []
+    stop = threading.Event()
+
+    def consume(columns: Sequence[str]) -> None:
+        """ format and log batches until the sentinel arrives """
+        try:
+            while True:
+                rows = batches.get()
+                if rows is None:
+                    return
+                for row in rows:
+                    logger.info(dict(zip(columns, row)))
+        except Exception as e:
+            failure.append(e)
+            stop.set()
+            while batches.get() is not None:
+                pass
+
+    rows_count = 0
+    batches_count = 0
+    start = time.perf_counter()
+    cursor = database.cursor()
+    try:
+        cursor.execute("SELECT * FROM users;")
+        columns = [desc[0] for desc in cursor.description]
+        worker = threading.Thread(target=consume, args=(columns,),
+                                  name="user_data-export", daemon=True)
+        worker.start()
+        try:
+            for rows in fetch_batches(cursor, batch_size):
+                if stop.is_set():
+                    break
+                batches.put(rows)
+                rows_count += len(rows)
+                batches_count += 1
+        finally:
+            batches.put(None)
+            worker.join()
+        if failure:
+            # unbuffered cursors refuse to close with rows left unread;
+            # the consumer error is the one reported either way
+            try:
+                for _ in fetch_batches(cursor, batch_size):
+                    pass
+            except Exception:
+                pass
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            if not failure:
+                raise
+        finally:
+            if owns_database:
+                database.close()
+    if failure:
+        raise failure[0]
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows_count,
+        "batches": batches_count,
+        "seconds": seconds,
+        "rows_per_sec": rows_count / seconds if seconds > 0 else 0.0,
+    }
+
+
 def main() -> None:
     """
     main function to fetch user data from the database and log it.
     """
-    database = get_db()
-    cursor = database.cursor()
-    cursor.execute("SELECT * FROM users;")
     logger = get_logger()
-    for row in cursor:
-        data = []
-        for desc, value in zip(cursor.description, row):
-            pair = f"{desc[0]}={str(value)}"
-            data.append(pair)
-        row_str = "; ".join(data)
-        logger.info(row_str)
-    cursor.close()
-    database.close()
+    summary = export_users(logger=logger)
+    logger.info("rows={rows}; batches={batches}; seconds={seconds:.3f}; "
+                "rows_per_sec={rows_per_sec:.1f};".format(**summary))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+scrub PII from existing log files in parallel, using the same
+fields and separator rules as RedactingFormatter, except that a value
+also ends at the end of its line.
+
+usage: ./redact_logs.py [-w WORKERS] [-c CHUNK_MB] INPUT OUTPUT
+"""
+
+import os
+import sys
+import mmap
+import time
+import argparse
+import multiprocessing
+from typing import Iterator, List, Sequence, Tuple
+from filtered_logger import (
+    PII_FIELDS,
+    RedactingFormatter,
+    get_redaction_engine
+)
+
+
+CHUNK_SIZE = 16 * 1024 * 1024
+ENCODING = "utf-8"
+
+_source = None
+_engine = None
+_redaction = None
+
+
+def chunk_bounds(data, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple]:
+    """
+    split a buffer into chunks that end on line boundaries.
+    Args:
+        data: A bytes-like buffer supporting find (e.g. an mmap).
+        chunk_size (int): Approximate size of each chunk in bytes.
+    Yields:
+        Tuple[int, int]: The (start, end) offsets of each chunk.
+    """
+    size = len(data)
+    start = 0
+    while start < size:
+        end = data.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def _init_worker(file_path: str, fields: Sequence[str],
+                 separator: str, redaction: str) -> None:
+    """
+    map the input file and build the redaction engine once per worker.
+    """
+    global _source, _engine, _redaction
+    with open(file_path, "rb") as f:
+        _source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _engine = get_redaction_engine(fields, separator, line_bound=True)
+    _redaction = redaction
+
+
+def _redact_chunk(bounds: Tuple[int, int]) -> bytes:
+    """
+    redact one chunk of the mapped input file.
+    Raises:
+        ValueError: If the chunk lost or gained lines.
+    """
+    start, end = bounds
+    source = _source[start:end]
+    text = source.decode(ENCODING, "surrogateescape")
+    data = _engine.redact(text, _redaction).encode(ENCODING,
+                                                   "surrogateescape")
+    if data.count(b"\n") != source.count(b"\n"):
+        raise ValueError("redacting bytes {}-{} changed the number of "
+                         "lines".format(start, end))
+    return data
+
+
+def redact_file(src: str, dst: str,
+                fields: Sequence[str] = PII_FIELDS,
+                separator: str = RedactingFormatter.SEPARATOR,
+                redaction: str = RedactingFormatter.REDACTION,
+                workers: int = None,
+                chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    redact every line of src into dst across a pool of processes.
+    chunks are redacted out of order but written back in order.
+    Args:
+        src (str): Path of the log file to scrub.
+        dst (str): Path of the redacted output file.
+        fields (Sequence[str]): Fields to be redacted.
+        separator (str): The character that separates fields.
+        redaction (str): The string to replace the field values.
+        workers (int): Number of worker processes, defaults to the
+            number of CPUs.
+        chunk_size (int): Approximate size of each chunk in bytes.
+    Returns:
+        dict: bytes, chunks, workers, seconds and gb_per_sec.
+    Raises:
+        ValueError: If redaction spans lines.
+    """
+    if "\n" in redaction:
+        raise ValueError("the redaction cannot contain a newline")
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    size = os.path.getsize(src)
+    chunks = 0
+    with open(dst, "wb") as out:
+        if size > 0:
+            with open(src, "rb") as f:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                bounds = list(chunk_bounds(source, chunk_size))
+            finally:
+                source.close()
+            initargs = (src, tuple(fields), separator, redaction)
+            with multiprocessing.Pool(workers, _init_worker,
+                                      initargs) as pool:
+                for data in pool.imap(_redact_chunk, bounds):
+                    out.write(data)
+                    chunks += 1
+    seconds = time.perf_counter() - start
+    return {
+        "bytes": size,
+        "chunks": chunks,
+        "workers": workers,
+        "seconds": seconds,
+        "gb_per_sec": size / seconds / 1e9 if seconds > 0 else 0.0,
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    command line entry point.
+    """
+    parser = argparse.ArgumentParser(
+        description="Redact PII fields from existing log files.")
+    parser.add_argument("input", help="log file to scrub")
+    parser.add_argument("output", help="where to write the redacted log")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("-c", "--chunk-mb", type=float,
+                        default=CHUNK_SIZE / 1024 / 1024,
+                        help="approximate chunk size in MiB")
+    parser.add_argument("-f", "--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to redact")
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR,
+                        help="field separator")
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION,
+                        help="replacement for redacted values")
+    args = parser.parse_args(argv)
+    summary = redact_file(args.input, args.output,
+                          fields=args.fields.split(","),
+                          separator=args.separator,
+                          redaction=args.redaction,
+                          workers=args.workers,
+                          chunk_size=max(1, int(args.chunk_mb * 1024 * 1024)))
+    print("{bytes} bytes in {chunks} chunks, {workers} workers: "
+          "{seconds:.3f}s ({gb_per_sec:.3f} GB/s)".format(**summary),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,75 @@ define the Auth class for handling
 authentication-related functionalities.
 """
 
+import bisect
+import functools
 from flask import request
 from typing import (
+    Iterable,
     List,
     TypeVar
 )
 
 
+MATCH_CACHE_SIZE = 4096
+
+
+class ExcludedPaths(tuple):
+    """
+    excluded paths compiled once for Auth.require_auth.
+    A path is excluded when it is a prefix of an excluded path, when an
+    excluded path is a prefix of it, or when it starts with an excluded
+    path ending with "*" minus the "*". Instead of trying every excluded
+    path, the first rule is one bisection in the sorted excluded paths,
+    and the others one set lookup per distinct prefix length; results
+    are memoized per path.
+    """
+
+    def __new__(cls, paths: Iterable[str]):
+        """
+        compile the excluded paths.
+        Args:
+            paths (Iterable[str]): The unauthenticated paths.
+        """
+        self = super().__new__(cls, paths)
+        self._sorted = sorted(self)
+        self._prefixes = set(self)
+        self._prefixes.update(p[:-1] for p in self if p.endswith("*"))
+        self._lengths = sorted({len(p) for p in self._prefixes})
+        self.match = functools.lru_cache(MATCH_CACHE_SIZE)(self._match)
+        return self
+
+    def _match(self, path: str) -> bool:
+        """
+        determine if a path is excluded.
+        Args:
+            path (str): The request path to check.
+        Returns:
+            bool: True if the path is excluded, False otherwise.
+        """
+        i = bisect.bisect_left(self._sorted, path)
+        if i < len(self._sorted) and self._sorted[i].startswith(path):
+            return True
+        for length in self._lengths:
+            if length > len(path):
+                break
+            if path[:length] in self._prefixes:
+                return True
+        return False
+
+
+@functools.lru_cache(32)
+def compile_excluded_paths(paths: tuple) -> ExcludedPaths:
+    """
+    compile excluded paths given as a list, reusing the last results.
+    Args:
+        paths (tuple): The unauthenticated paths.
+    Returns:
+        ExcludedPaths: The compiled paths.
+    """
+    return ExcludedPaths(paths)
+
+
 class Auth:
     """
     Auth class to manage the authentication of requests.
@@ -21,26 +83,18 @@ class Auth:
         determine if authentication is required for a given path.
         Args:
             path (str): The request path to check.
-            excluded_paths (List[str]): A list of unauthenticated paths.
+            excluded_paths (List[str]): A list of unauthenticated paths,
+                best compiled once into ExcludedPaths.
         Returns:
             bool: True if authentication is required, False otherwise.
         """
         if path is None:
             return True
-        elif excluded_paths is None or excluded_paths == []:
+        elif excluded_paths is None or len(excluded_paths) == 0:
             return True
-        elif path in excluded_paths:
-            return False
-        else:
-            for i in excluded_paths:
-                if i.startswith(path):
-                    return False
-                if path.startswith(i):
-                    return False
-                if i[-1] == "*":
-                    if path.startswith(i[:-1]):
-                        return False
-        return True
+        elif not isinstance(excluded_paths, ExcludedPaths):
+            excluded_paths = compile_excluded_paths(tuple(excluded_paths))
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """
@@ -3,20 +3,63 @@
 Module of Users views
 """
 
-from flask import abort, jsonify, request
+import json
+from typing import Tuple
+from flask import Response, abort, jsonify, request, url_for
 from api.v1.views import app_views
 from models.user import User
 
 
+def stream_json_list(users):
+    """
+    yield the JSON array of users piece by piece.
+    """
+    yield "["
+    for i, user in enumerate(users):
+        yield ("," if i else "") + json.dumps(user.to_json(cache=False))
+    yield "]\n"
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """
     GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users in the page
+      - cursor: ID of the last user of the previous page
+      - stream: 1 to stream the JSON array instead of building it
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented (ordered by ID when
+        limit or cursor is given)
+      - X-Next-Cursor and Link headers pointing to the next page
+      - 400 if limit is not a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream') in ('1', 'true')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    if limit is None and cursor is None:
+        users, next_cursor = User.all(), None
+    else:
+        users, next_cursor = User.page(cursor, limit)
+    if stream:
+        resp = Response(stream_json_list(users), mimetype='application/json')
+    else:
+        resp = jsonify([user.to_json(cache=False) for user in users])
+    if next_cursor is not None:
+        next_args = {'cursor': next_cursor, 'limit': limit}
+        if stream:
+            next_args['stream'] = 1
+        resp.headers['X-Next-Cursor'] = next_cursor
+        resp.headers['Link'] = '<{}>; rel="next"'.format(
+            url_for('app_views.view_all_users', **next_args))
+    return resp
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -56,6 +99,29 @@ def delete_user(user_id: str = None) -> str:
     return jsonify({}), 200
 
 
+def build_user(rj: dict) -> Tuple[User, str]:
+    """
+    build an unsaved User from the JSON of POST /api/v1/users.
+    Return:
+      - the User and None, or None and the error message
+    """
+    if not isinstance(rj, dict):
+        return None, "Wrong format"
+    if rj.get("email", "") == "":
+        return None, "email missing"
+    if rj.get("password", "") == "":
+        return None, "password missing"
+    try:
+        user = User()
+        user.email = rj.get("email")
+        user.password = rj.get("password")
+        user.first_name = rj.get("first_name")
+        user.last_name = rj.get("last_name")
+    except Exception as e:
+        return None, "Can't create User: {}".format(e)
+    return user, None
+
+
 @app_views.route('/users', methods=['POST'], strict_slashes=False)
 def create_user() -> str:
     """
@@ -70,24 +136,13 @@ def create_user() -> str:
       - 400 if can't create the new User
     """
     rj = None
-    error_msg = None
     try:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
-        error_msg = "Wrong format"
-    if error_msg is None and rj.get("email", "") == "":
-        error_msg = "email missing"
-    if error_msg is None and rj.get("password", "") == "":
-        error_msg = "password missing"
+    user, error_msg = build_user(rj)
     if error_msg is None:
         try:
-            user = User()
-            user.email = rj.get("email")
-            user.password = rj.get("password")
-            user.first_name = rj.get("first_name")
-            user.last_name = rj.get("last_name")
             user.save()
             return jsonify(user.to_json()), 201
         except Exception as e:
@@ -95,6 +150,51 @@ def create_user() -> str:
     return jsonify({'error': error_msg}), 400
 
 
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """
+    POST /api/v1/users/batch
+    Body, one item per user with the fields of POST /api/v1/users:
+      - JSON array
+      - or one JSON object per line, with the application/x-ndjson
+        content type
+    Return:
+      - per-item results in the order of the body: {"status": 201,
+        "user": User object JSON represented} or {"status": 400,
+        "error": message}; the created Users are saved at once
+      - 201 if at least one User was created, 400 otherwise
+    """
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in request.stream:
+            if line.strip() == b"":
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = []
+    for rj in items:
+        user, error_msg = build_user(rj)
+        if error_msg is None:
+            users.append(user)
+            results.append(user)
+        else:
+            results.append({'status': 400, 'error': error_msg})
+    try:
+        User.save_many(users)
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+    results = [{'status': 201, 'user': r.to_json(cache=False)}
+               if isinstance(r, User) else r for r in results]
+    return jsonify(results), 201 if len(users) > 0 else 400
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """
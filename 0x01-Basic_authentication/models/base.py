@@ -1,21 +1,334 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Iterator, Tuple, IO
+from os import getenv, path
+from models import snapshot
+from models.journal import Journal
+from models.sqlite_storage import SQLiteStorage
+from models.writer import WriteBehindWriter
+import atexit
+import bisect
+import contextlib
+import gc
+import io
+import itertools
 import json
+import operator
+import os
+import re
+import threading
+import time
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+STORAGE = getenv("MODEL_STORAGE", "file")
+SQLITE_PATH = getenv("MODEL_SQLITE_PATH", ".db.sqlite3")
+STORE_MODE = getenv("MODEL_STORE_MODE", "file")
+JOURNAL_COMPACT_BYTES = int(getenv("MODEL_JOURNAL_COMPACT_BYTES",
+                                   4 * 1024 * 1024))
+JOURNAL_FSYNC = getenv("MODEL_JOURNAL_FSYNC", "0") == "1"
+WRITE_BEHIND_INTERVAL = float(getenv("MODEL_WRITE_BEHIND_INTERVAL", "0"))
+COMPACT_MODELS = getenv("MODEL_COMPACT", "0") == "1"
+REFRESH_INTERVAL = float(getenv("MODEL_REFRESH_INTERVAL", "-1"))
+SNAPSHOT_FORMAT = getenv("MODEL_SNAPSHOT_FORMAT", "json")
+SNAPSHOT_EXTENSIONS = {"json": "json", "binary": "bin"}
+EPOCH = datetime(1970, 1, 1)
+READ_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+MODELS = {}
 DATA = {}
+INDEXES = {}
+SORTED_IDS = {}
+JOURNALS = {}
+LOCKS = {}
+SIGNATURES = {}
+REFRESHED = {}
+SAVE_SECONDS = {}
+WRITER = None
+STORAGES = {
+    "sqlite": lambda: SQLiteStorage(SQLITE_PATH),
+}
+_storage = None
+_init_lock = threading.Lock()
+
+
+def write_json_file(file_path: str, objs_json: dict,
+                    fsync: bool = False) -> tuple:
+    """ Atomically replace file_path with the JSON of objs_json, and
+    return the file_signature of the new file
+    The document is encoded in one call, which is about 2.5 times
+    faster than the piecewise encoding of json.dump.
+    """
+    return write_file(file_path, json.dumps(objs_json), fsync)
+
+
+def write_file(file_path: str, data: object, fsync: bool = False) -> tuple:
+    """ Atomically replace file_path with data (str or bytes), and
+    return the file_signature of the new file
+    With fsync, the directory is synced too, so that the rename is
+    durable before the caller drops anything the file replaces (e.g.
+    the journal).
+    """
+    tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        signature = stat_signature(os.fstat(f.fileno()))
+    os.replace(tmp_path, file_path)
+    if fsync:
+        fsync_directory(path.dirname(file_path))
+    return signature
+
+
+def fsync_directory(dir_path: str):
+    """ Flush the entries of dir_path (the current directory if empty)
+    """
+    fd = os.open(dir_path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def stat_signature(stat: os.stat_result) -> tuple:
+    """ What identifies a version of a file: inode, size and mtime
+    """
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def file_signature(file_path: str) -> tuple:
+    """ stat_signature of file_path, None if it does not exist
+    """
+    try:
+        return stat_signature(os.stat(file_path))
+    except FileNotFoundError:
+        return None
+
+
+def file_size(file_path: str) -> int:
+    """ Size of file_path in bytes, 0 if it does not exist
+    """
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """ Pause the cyclic garbage collector, which would otherwise run
+    over and over while a large store is loaded, finding no garbage
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    datetime.fromisoformat reads this format an order of magnitude
+    faster than datetime.strptime.
+    """
+    return datetime.fromisoformat(value)
+
+
+def iter_json_items(f: IO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[
+        Tuple[str, object]]:
+    """ Stream the (key, value) pairs of the top-level JSON object in f
+    Only one chunk of the document is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def _skip(expected: str = None):
+        """ Skip whitespace, then consume expected if given """
+        nonlocal buf, pos, eof
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                break
+            buf, pos = f.read(chunk_size), 0
+            eof = buf == ""
+        if expected is None:
+            return buf[pos:pos + 1]
+        if buf[pos:pos + 1] != expected:
+            raise ValueError("Expecting '{}' at {}".format(expected, pos))
+        pos += 1
+
+    def _decode():
+        """ Decode the next value, reading more input as needed """
+        nonlocal buf, pos, eof
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # a number cut by the chunk ("1." then "5") goes on
+                truncated = end == len(buf) or \
+                    type(value) in (int, float) and buf[end] in _NUMBER_CHARS
+                if eof or not truncated:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more = f.read(chunk_size)
+            eof = more == ""
+            buf, pos = buf[pos:] + more, 0
+
+    _skip("{")
+    if _skip() == "}":
+        return
+    while True:
+        _skip()
+        key = _decode()
+        _skip(":")
+        _skip()
+        yield key, _decode()
+        if _skip() == "}":
+            return
+        _skip(",")
+
+
+def get_storage():
+    """ Return the storage backend selected by STORAGE
+    None stands for the default JSON file store kept in DATA.
+    """
+    global _storage
+    if STORAGE == "file":
+        return None
+    with _init_lock:
+        if _storage is None:
+            if STORAGE not in STORAGES:
+                raise ValueError("Unknown MODEL_STORAGE: {}".format(STORAGE))
+            _storage = STORAGES[STORAGE]()
+    return _storage
+
+
+def get_writer() -> WriteBehindWriter:
+    """ Return the write-behind writer, starting it on first use
+    """
+    global WRITER
+    with _init_lock:
+        if WRITER is None:
+            WRITER = WriteBehindWriter(WRITE_BEHIND_INTERVAL)
+            WRITER.start()
+            atexit.register(WRITER.stop)
+    return WRITER
+
+
+class HashIndex():
+    """ Hash index of one attribute: value -> objects having it
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on attribute
+        """
+        self.attribute = attribute
+        self.entries = {}
+        self.values = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current attribute value
+        """
+        value = getattr(obj, self.attribute, None)
+        if obj.id in self.values:
+            if self.values[obj.id] == value:
+                self.entries[value][obj.id] = obj
+                return
+            self.discard(obj.id)
+        try:
+            bucket = self.entries.setdefault(value, {})
+        except TypeError:
+            return
+        bucket[obj.id] = obj
+        self.values[obj.id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = self.entries[value]
+        del bucket[obj_id]
+        if len(bucket) == 0:
+            del self.entries[value]
+
+    def bucket(self, value) -> dict:
+        """ Return the objects indexed under value, by ID; the dictionary
+        is the index's own and must not be modified
+        """
+        return self.entries.get(value, {})
+
+    def lookup(self, value) -> List[TypeVar('Base')]:
+        """ Return the objects indexed under value
+        """
+        return list(self.bucket(value).values())
+
+
+def _same_objects(values: tuple, others: tuple) -> bool:
+    """ Whether both tuples hold the very same objects: equal values of
+    another type (1 and True) or identity (a new str) differ
+    """
+    return len(values) == len(others) and \
+        all(map(operator.is_, values, others))
+
+
+def _compact_timestamp(slot: str) -> property:
+    """ Property storing a datetime as integer seconds since EPOCH
+    """
+    second = timedelta(seconds=1)
+
+    def _get(self) -> datetime:
+        """ Timestamp as a datetime """
+        return EPOCH + timedelta(seconds=getattr(self, slot))
+
+    def _set(self, value: datetime):
+        """ Store the timestamp, truncated to the second """
+        setattr(self, slot, (value - EPOCH) // second)
+
+    return property(_get, _set)
 
 
 class Base():
     """ Base class
+    Objects of a class are safe to use from several threads: mutations
+    of the store are serialized by a per-class lock, while readers take
+    no lock and work on atomic snapshots (dict and list copies), so they
+    never wait for a writer.
+    With MODEL_COMPACT=1, models declaring __slots__ hold no __dict__
+    and timestamps are stored as integer seconds (what is serialized
+    anyway) instead of datetime objects.
+    The JSON cache lives in a slot in both modes, out of the attributes.
     """
 
+    INDEXED_ATTRIBUTES = ()
+    if COMPACT_MODELS:
+        __slots__ = ("id", "_created_ts", "_updated_ts", "_json_cache")
+        _SLOT_FIELDS = {"_created_ts": "created_at",
+                        "_updated_ts": "updated_at"}
+        created_at = _compact_timestamp("_created_ts")
+        updated_at = _compact_timestamp("_updated_ts")
+    else:
+        __slots__ = ("__dict__", "__weakref__", "_json_cache")
+
+    def __init_subclass__(cls, **kwargs: dict):
+        """ Register every model class in MODELS, by name
+        """
+        super().__init_subclass__(**kwargs)
+        MODELS[cls.__name__] = cls
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -23,15 +336,16 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        if 'id' in kwargs:
+            self.id = kwargs['id']
+        else:
+            self.id = str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,95 +358,633 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    @classmethod
+    def _slots(cls) -> Tuple[str, ...]:
+        """ Names of the slots holding attributes, in declaration order
+        """
+        names = cls.__dict__.get("_SLOTS")
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get("__slots__", ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                names.extend(slot for slot in slots if slot not in (
+                    "__dict__", "__weakref__", "_json_cache"))
+            names = tuple(names)
+            cls._SLOTS = names
+        return names
+
+    @classmethod
+    def _slot_values(cls) -> operator.attrgetter:
+        """ Getter of the values of _slots(), as a tuple
+        """
+        getter = cls.__dict__.get("_SLOT_VALUES")
+        if getter is None:
+            getter = operator.attrgetter(*cls._slots())
+            cls._SLOT_VALUES = getter
+        return getter
+
+    @classmethod
+    def _fields(cls) -> Tuple[str, ...]:
+        """ Names of the attributes stored in slots, in declaration order
+        """
+        fields = cls.__dict__.get("_FIELDS")
+        if fields is None:
+            fields = tuple(Base._SLOT_FIELDS.get(slot, slot)
+                           for slot in cls._slots())
+            cls._FIELDS = fields
+        return fields
+
+    def _attributes(self) -> Iterator[Tuple[str, object]]:
+        """ (name, value) of every attribute of the object
         """
+        if not COMPACT_MODELS:
+            return iter(self.__dict__.items())
+        attributes = [(key, getattr(self, key)) for key in self._fields()]
+        if hasattr(self, "__dict__"):
+            attributes.extend(self.__dict__.items())
+        return iter(attributes)
+
+    def _state(self) -> tuple:
+        """ Values of every attribute as stored (integer timestamps in
+        compact mode), to detect modifications
+        """
+        if not COMPACT_MODELS:
+            return tuple(self.__dict__.values())
+        state = self._slot_values()(self)
+        if hasattr(self, "__dict__"):
+            state += tuple(self.__dict__.values())
+        return state
+
+    def _stored(self) -> List[Tuple[str, object]]:
+        """ (name, value) of every attribute as stored, read at once:
+        slot names and integer timestamps in compact mode
+        """
+        if not COMPACT_MODELS:
+            return list(self.__dict__.items())
+        stored = list(zip(self._slots(), self._slot_values()(self)))
+        if hasattr(self, "__dict__"):
+            stored.extend(self.__dict__.items())
+        return stored
+
+    def _json(self, for_serialization: bool = False,
+              cache: bool = True) -> dict:
+        """ JSON dictionary of the object, not to be modified
+        With cache, the variant is kept in one (values, public, serial)
+        tuple, created on first use and replaced as a whole, and reused
+        for as long as every attribute holds the very same objects. With
+        cache False, a variant still valid is reused but a new one is not
+        kept, so that serializing a whole collection leaves no copy of
+        every object in memory.
+        """
+        cached = getattr(self, "_json_cache", None)
+        if cached is not None and _same_objects(cached[0], self._state()):
+            result = cached[1 + for_serialization]
+            if result is not None:
+                return result
+        stored = self._stored()
+        state = tuple([value for _, value in stored])
+        if cached is None or not _same_objects(cached[0], state):
+            cached = (state, None, None)
+        timestamps = Base._SLOT_FIELDS if COMPACT_MODELS else {}
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in stored:
+            if key in timestamps:
+                key = timestamps[key]
+                value = EPOCH + timedelta(seconds=value)
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
                 result[key] = value.strftime(TIMESTAMP_FORMAT)
             else:
                 result[key] = value
+        if cache:
+            self._json_cache = (cached[:1 + for_serialization] + (result,) +
+                                cached[2 + for_serialization:])
         return result
 
+    def to_json(self, for_serialization: bool = False,
+                cache: bool = True) -> dict:
+        """ Convert the object a JSON dictionary
+        cache False keeps nothing on the object, e.g. when a whole
+        collection is serialized.
+        """
+        return dict(self._json(for_serialization, cache))
+
+    @classmethod
+    def _lock(cls) -> threading.RLock:
+        """ Return the lock serializing the mutations of the class
+        """
+        lock = LOCKS.get(cls.__name__)
+        if lock is None:
+            with _init_lock:
+                lock = LOCKS.setdefault(cls.__name__, threading.RLock())
+        return lock
+
+    @classmethod
+    def _snapshot_path(cls, snapshot_format: str = None) -> str:
+        """ Path of the snapshot file of the class in snapshot_format,
+        SNAPSHOT_FORMAT by default
+        """
+        snapshot_format = snapshot_format or SNAPSHOT_FORMAT
+        if snapshot_format not in SNAPSHOT_EXTENSIONS:
+            raise ValueError("Unknown MODEL_SNAPSHOT_FORMAT: {}".format(
+                snapshot_format))
+        return ".db_{}.{}".format(cls.__name__,
+                                  SNAPSHOT_EXTENSIONS[snapshot_format])
+
+    @classmethod
+    def _read_snapshot(cls, f: IO) -> Iterator[Tuple[str, TypeVar('Base')]]:
+        """ Stream the (ID, object) pairs of the snapshot file f, opened
+        in binary mode; the format is told by the first bytes
+        Objects of a binary snapshot hold their saved attributes as is,
+        so they are restored attribute by attribute without calling
+        __init__ (as pickle does), which is about twice as fast.
+        """
+        head = f.read(len(snapshot.MAGIC))
+        f.seek(0)
+        if snapshot.is_snapshot(head):
+            names, rows = snapshot.loads(f.read())
+            for values in rows:
+                obj = cls.__new__(cls)
+                for name, value in zip(names, values):
+                    try:
+                        setattr(obj, name, value)
+                    except AttributeError:
+                        pass
+                yield obj.id, obj
+            return
+        text = io.TextIOWrapper(f, encoding='utf-8')
+        try:
+            for obj_id, obj_json in iter_json_items(text):
+                yield obj_id, cls(**obj_json)
+        finally:
+            text.detach()
+
+    @classmethod
+    def _dump_snapshot(cls) -> bytes:
+        """ Binary snapshot of all objects; the caller holds the lock
+        The attribute dictionaries of the objects are used as they are,
+        unless they are (partly) stored in slots.
+        """
+        objs = DATA[cls.__name__].values()
+        if COMPACT_MODELS:
+            return snapshot.dumps([dict(obj._attributes()) for obj in objs])
+        rows = [obj.__dict__ for obj in objs]
+        return snapshot.dumps(rows)
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+        The snapshot is loaded first, then the journal is replayed on
+        top of it. Objects are loaded into a new dictionary that only
+        replaces the previous one once complete.
+        A snapshot only found in the other SNAPSHOT_EXTENSIONS format is
+        converted: it is loaded, saved in SNAPSHOT_FORMAT along with the
+        journal replayed on top of it, then removed.
+        """
+        with cls._lock():
+            cls._load_from_file()
+
+    @classmethod
+    def _load_from_file(cls):
+        """ Load all objects from file; the caller holds the lock
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
+        storage = get_storage()
+        if storage is not None:
+            DATA[s_class] = {}
+            INDEXES.pop(s_class, None)
+            SORTED_IDS.pop(s_class, None)
+            storage.load(cls, cls._snapshot_path())
+            return
+        objs = {}
+        signature = None
+        replayed = 0
+        file_path = cls._snapshot_path()
+        converted = None
         if not path.exists(file_path):
+            for snapshot_format in SNAPSHOT_EXTENSIONS:
+                other_path = cls._snapshot_path(snapshot_format)
+                if path.exists(other_path):
+                    file_path = converted = other_path
+        journal = cls._journal()
+        with journal.exclusive():
+            if path.exists(file_path):
+                with open(file_path, 'rb') as f, gc_paused():
+                    signature = stat_signature(os.fstat(f.fileno()))
+                    for obj_id, obj in cls._read_snapshot(f):
+                        objs[obj_id] = obj
+
+            for record in journal.replay():
+                if record.get("op") == "remove":
+                    objs.pop(record.get("id"), None)
+                else:
+                    obj = cls(**record.get("obj"))
+                    objs[obj.id] = obj
+                replayed += 1
+            DATA[s_class] = objs
+            INDEXES.pop(s_class, None)
+            SORTED_IDS.pop(s_class, None)
+            SIGNATURES[s_class] = signature
+            if converted is not None:
+                # compacted here: compact() would find the new snapshot
+                # missing, hence stale, and load it again
+                cls.save_to_file(fsync=True)
+                journal.truncate()
+        if converted is None and replayed > 0 and STORE_MODE != "journal":
+            cls.compact()
+        if converted is not None:
+            try:
+                os.remove(converted)
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def refresh(cls, force: bool = False):
+        """ Reload what other processes changed in the files of the class
+        Only classes loaded or saved by this process are followed. The
+        files are checked (two stat calls) at most once per
+        REFRESH_INTERVAL seconds unless force, and never when it is
+        negative: a replaced snapshot is reloaded, while records
+        appended to the journal are replayed on the loaded objects.
+        """
+        if REFRESH_INTERVAL < 0 or get_storage() is not None:
             return
+        s_class = cls.__name__
+        if s_class not in SIGNATURES:
+            return
+        now = time.monotonic()
+        if not force and now < REFRESHED.get(s_class, 0) + REFRESH_INTERVAL:
+            return
+        REFRESHED[s_class] = now
+        journal = cls._journal()
+        if file_signature(cls._snapshot_path()) == \
+                SIGNATURES[s_class] and \
+                journal.file_size() == journal.position:
+            return
+        with cls._lock():
+            cls._reload_changes()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _reload_changes(cls):
+        """ Reload what other processes changed; the caller holds the lock
+        Changes not yet written by the background writer are kept: they
+        overwrite the file anyway.
+        """
+        s_class = cls.__name__
+        if WRITER is not None and WRITER.backlog(cls) > 0:
+            return
+        journal = cls._journal()
+        journal.commit()
+        with journal.shared():
+            stale = file_signature(cls._snapshot_path()) != \
+                SIGNATURES.get(s_class) or \
+                journal.file_size() < journal.position
+            if not stale:
+                for record in journal.tail():
+                    if record.get("op") == "remove":
+                        obj = DATA[s_class].get(record.get("id"))
+                        if obj is not None:
+                            cls._discard(obj)
+                    else:
+                        cls._insert(cls(**record.get("obj")))
+        if stale:
+            cls._load_from_file()
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def save_to_file(cls, fsync: bool = False):
+        """ Save all objects to file, in SNAPSHOT_FORMAT
         """
+        if get_storage() is not None:
+            return
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        file_path = cls._snapshot_path()
+        with cls._lock(), gc_paused():
+            start = time.perf_counter()
+            if SNAPSHOT_FORMAT == "binary":
+                signature = write_file(file_path, cls._dump_snapshot(),
+                                       fsync)
+            else:
+                objs_json = {}
+                for obj_id, obj in list(DATA[s_class].items()):
+                    objs_json[obj_id] = obj._json(True, False)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+                signature = write_json_file(file_path, objs_json, fsync)
+            SIGNATURES[s_class] = signature
+            SAVE_SECONDS[s_class] = time.perf_counter() - start
+
+    @classmethod
+    def _journal(cls) -> Journal:
+        """ Return the journal of the class
+        """
+        s_class = cls.__name__
+        journal = JOURNALS.get(s_class)
+        if journal is None:
+            journal = Journal(".db_{}.journal".format(s_class),
+                              JOURNAL_FSYNC)
+            JOURNALS[s_class] = journal
+        return journal
+
+    @classmethod
+    def compact(cls):
+        """ Fold the journal into the snapshot file
+        Replaying a record twice is harmless, so a crash between the
+        snapshot write and the journal truncation loses nothing. Appends
+        of every process are held off meanwhile, and what they appended
+        before is loaded first so that the snapshot includes it.
+        """
+        with cls._lock():
+            journal = cls._journal()
+            with journal.exclusive():
+                cls._reload_changes()
+                cls.save_to_file(fsync=True)
+                journal.truncate()
+
+    @classmethod
+    def sync(cls, timeout: float = None) -> bool:
+        """ Wait until the mutations made so far are written to disk
+        Only write-behind mode defers writes; False if timeout expired.
+        Raises the error of the last write if it failed.
+        """
+        if WRITER is None:
+            return True
+        return WRITER.wait(cls, timeout)
+
+    @classmethod
+    def _log(cls, record: dict):
+        """ Queue the journal record of one mutation, in "journal"
+        STORE_MODE; the caller holds the lock, which keeps the records
+        in the order of the mutations
+        """
+        if STORE_MODE == "journal":
+            cls._journal().enqueue(record)
+
+    @classmethod
+    def _persist(cls):
+        """ Persist the mutations made so far, without holding the lock
+        In "journal" STORE_MODE the queued records are committed, so
+        that concurrent writers share one write; the journal is
+        compacted once it outgrows both JOURNAL_COMPACT_BYTES and the
+        snapshot (keeping compaction cost amortized O(1)).
+        Otherwise the whole snapshot is rewritten: right away, or by the
+        background writer when WRITE_BEHIND_INTERVAL is set.
+        """
+        if STORE_MODE != "journal":
+            if WRITE_BEHIND_INTERVAL > 0:
+                get_writer().mark(cls)
+            else:
+                cls.save_to_file()
+            return
+        journal = cls._journal()
+        journal.commit()
+        size = journal.size()
+        if size >= JOURNAL_COMPACT_BYTES:
+            file_path = cls._snapshot_path()
+            if not path.exists(file_path) or \
+                    size >= path.getsize(file_path):
+                cls.compact()
+
+    @classmethod
+    def _indexes(cls) -> dict:
+        """ Return the indexes of the class, by attribute
+        They are built on first use, under the lock so that no
+        concurrent save is missed.
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class)
+        if indexes is None:
+            with cls._lock():
+                indexes = INDEXES.get(s_class)
+                if indexes is None:
+                    indexes = {a: HashIndex(a)
+                               for a in cls.INDEXED_ATTRIBUTES}
+                    for obj in list(DATA.get(s_class, {}).values()):
+                        for index in indexes.values():
+                            index.add(obj)
+                    INDEXES[s_class] = indexes
+        return indexes
+
+    @classmethod
+    def _insert(cls, obj: TypeVar('Base')):
+        """ Store obj in memory; the caller holds the lock
+        """
+        s_class = cls.__name__
+        if obj.id not in DATA[s_class] and s_class in SORTED_IDS:
+            bisect.insort(SORTED_IDS[s_class], obj.id)
+        DATA[s_class][obj.id] = obj
+        for index in cls._indexes().values():
+            index.add(obj)
+
+    @classmethod
+    def _discard(cls, obj: TypeVar('Base')):
+        """ Drop obj from memory; the caller holds the lock
+        """
+        s_class = cls.__name__
+        del DATA[s_class][obj.id]
+        for index in cls._indexes().values():
+            index.discard(obj.id)
+        if s_class in SORTED_IDS:
+            ids = SORTED_IDS[s_class]
+            del ids[bisect.bisect_left(ids, obj.id)]
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage = get_storage()
+        if storage is not None:
+            storage.save(self)
+            return
+        self.refresh(True)
+        with self._lock():
+            self._insert(self)
+            self._log({"op": "save", "obj": self._json(True, False)})
+        self.__class__._persist()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage = get_storage()
+        if storage is not None:
+            storage.remove(self)
+            return
+        self.refresh(True)
+        with self._lock():
+            if DATA[s_class].get(self.id) is None:
+                return
+            self._discard(self)
+            self._log({"op": "remove", "id": self.id})
+        self.__class__._persist()
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save several objects, persisting them once for the batch
+        """
+        objs = list(objs)
+        if len(objs) == 0:
+            return
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+        storage = get_storage()
+        if storage is not None:
+            storage.save_many(cls, objs)
+            return
+        cls.refresh(True)
+        with cls._lock():
+            for obj in objs:
+                cls._insert(obj)
+                cls._log({"op": "save", "obj": obj._json(True, False)})
+        cls._persist()
+
+    @classmethod
+    def remove_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Remove several objects, persisting them once for the batch
+        """
+        s_class = cls.__name__
+        objs = list(objs)
+        storage = get_storage()
+        if storage is not None:
+            storage.remove_many(cls, objs)
+            return
+        cls.refresh(True)
+        with cls._lock():
+            removed = 0
+            for obj in objs:
+                if DATA[s_class].get(obj.id) is None:
+                    continue
+                cls._discard(obj)
+                cls._log({"op": "remove", "id": obj.id})
+                removed += 1
+        if removed > 0:
+            cls._persist()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        storage = get_storage()
+        if storage is not None:
+            return storage.count(cls)
+        cls.refresh()
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
+    @classmethod
+    def stats(cls) -> dict:
+        """ Counters of the class for monitoring
+        They are read from what the store keeps up to date anyway:
+        nothing is loaded, refreshed, indexed or scanned, so polling
+        them does not touch the objects. Indexes not built yet are left
+        out, and pending_writes counts the mutations not written yet.
+        """
+        storage = get_storage()
+        if storage is not None:
+            return storage.stats(cls)
+        s_class = cls.__name__
+        journal = JOURNALS.get(s_class)
+        pending = 0 if journal is None else journal.pending()
+        if WRITER is not None:
+            pending += WRITER.backlog(cls)
+        return {
+            "count": len(DATA.get(s_class, ())),
+            "file_bytes": file_size(cls._snapshot_path()),
+            "journal_bytes": file_size(".db_{}.journal".format(s_class)),
+            "last_save_seconds": SAVE_SECONDS.get(s_class),
+            "indexes": {attribute: {"values": len(index.entries),
+                                    "objects": len(index.values)}
+                        for attribute, index
+                        in INDEXES.get(s_class, {}).items()},
+            "pending_writes": pending,
+        }
+
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, cursor: str = None, limit: int = None) -> Tuple[
+            List[TypeVar('Base')], str]:
+        """ Return up to limit objects ordered by ID, starting after the
+        cursor ID, and the cursor of the next page (None on the last)
+        """
+        storage = get_storage()
+        if storage is not None:
+            return storage.page(cls, cursor, limit)
+        cls.refresh()
+        s_class = cls.__name__
+        ids = SORTED_IDS.get(s_class)
+        if ids is None:
+            with cls._lock():
+                ids = SORTED_IDS.get(s_class)
+                if ids is None:
+                    ids = SORTED_IDS[s_class] = sorted(DATA[s_class])
+        start = 0 if cursor is None else bisect.bisect_right(ids, cursor)
+        end = len(ids) if limit is None else min(start + limit, len(ids))
+        window = ids[start:end]
+        objs = DATA[s_class]
+        objs = [obj for obj in map(objs.get, window) if obj is not None]
+        next_cursor = window[-1] if window and end < len(ids) else None
+        return objs, next_cursor
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        storage = get_storage()
+        if storage is not None:
+            return storage.get(cls, id)
+        cls.refresh()
         s_class = cls.__name__
         return DATA[s_class].get(id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
-        """ Search all objects with matching attributes
+    def search(cls, attributes: dict = {},
+               limit: int = None) -> List[TypeVar('Base')]:
+        """ Search all objects matching every attribute, up to limit
+        The indexed attributes are looked up from the most selective
+        (fewest objects under the value) to the least, each one
+        narrowing the candidates, and the search ends as soon as none
+        is left; every attribute is then checked on the candidates
+        only. Without usable index, all objects are scanned.
         """
+        storage = get_storage()
+        if storage is not None:
+            return storage.search(cls, attributes, limit)
+        cls.refresh()
         s_class = cls.__name__
+        indexes = cls._indexes()
+        buckets = []
+        for k, v in attributes.items():
+            index = indexes.get(k)
+            if index is None:
+                continue
+            try:
+                bucket = index.bucket(v)
+            except TypeError:
+                continue
+            if len(bucket) == 0:
+                return []
+            buckets.append(bucket)
+        if len(buckets) > 0:
+            buckets.sort(key=len)
+            candidates = list(buckets[0].values())
+            for bucket in buckets[1:]:
+                candidates = [obj for obj in candidates if obj.id in bucket]
+                if len(candidates) == 0:
+                    return []
+        else:
+            candidates = list(DATA[s_class].values())
 
         def _search(obj):
-            if len(attributes) == 0:
-                return True
             for k, v in attributes.items():
                 if (getattr(obj, k) != v):
                     return False
-                return True
+            return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        return list(itertools.islice(filter(_search, candidates), limit))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+""" Snapshot module
+Compact binary snapshot of the objects of one model class, stored by
+column. Each column holds the table of its distinct values, then one
+code per object indexing that table (0 standing for None), so
+repeated values are stored and decoded once.
+Layout, little-endian:
+    MAGIC, version (u16), objects (u64), columns (u16), then per column
+    name length (u16), name (UTF-8), kind (1 byte), table length (u32),
+    table size (u64), table, code typecode (1 byte), codes
+Tables by kind:
+    "s": str values joined by NUL, in UTF-8
+    "t": naive datetime values as int64 seconds since EPOCH
+    "j": JSON texts of any other values, joined by NUL
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Tuple
+from array import array
+import itertools
+import json
+import operator
+import struct
+import sys
+
+
+MAGIC = b"MODELDB\x00"
+VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_HEADER = struct.Struct("<HQH")
+_COLUMN = struct.Struct("<cIQ")
+_U16 = struct.Struct("<H")
+
+
+def is_snapshot(head: bytes) -> bool:
+    """ Whether a file starting with head is a binary snapshot
+    """
+    return head.startswith(MAGIC)
+
+
+def _pack_codes(codes: Iterable[int], size: int) -> bytes:
+    """ Typecode and bytes of codes, each below size
+    """
+    typecode = "B" if size <= 0xFF else "H" if size <= 0xFFFF else "I"
+    packed = array(typecode, codes)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return typecode.encode() + packed.tobytes()
+
+
+def _intern(values: List[object]) -> Tuple[list, Iterable[int]]:
+    """ Distinct values other than None, and the code of every value
+    When no value repeats (e.g. IDs), values are numbered in order,
+    which spares the lookups in a table as large as the column.
+    """
+    table = dict.fromkeys(values)
+    nones = 0
+    if None in table:
+        del table[None]
+        nones = values.count(None)
+    distinct = list(table)
+    if len(distinct) + nones == len(values):
+        if nones == 0:
+            return distinct, range(1, len(values) + 1)
+        present = list(map(operator.is_not, values, itertools.repeat(None)))
+        return distinct, list(map(operator.mul,
+                                  itertools.accumulate(present), present))
+    table = dict(zip(itertools.chain((None,), distinct), itertools.count()))
+    return distinct, list(map(table.__getitem__, values))
+
+
+def _column(values: List[object]) -> tuple:
+    """ Kind, table bytes, table length and codes of a column
+    """
+    types = set(map(type, values))
+    types.discard(type(None))
+    if types <= {str}:
+        distinct, codes = _intern(values)
+        text = "\0".join(distinct)
+        if text.count("\0") == max(len(distinct) - 1, 0):
+            return (b"s", text.encode("utf-8"), len(distinct),
+                    _pack_codes(codes, len(distinct) + 1))
+    elif types == {datetime}:
+        distinct, codes = _intern(values)
+        if all(v.tzinfo is None for v in distinct):
+            second = timedelta(seconds=1)
+            packed = array("q", [(v - EPOCH) // second for v in distinct])
+            if sys.byteorder != "little":
+                packed.byteswap()
+            return (b"t", packed.tobytes(), len(distinct),
+                    _pack_codes(codes, len(distinct) + 1))
+    distinct, codes = _intern([None if v is None else json.dumps(
+        v.strftime(TIMESTAMP_FORMAT) if type(v) is datetime else v)
+        for v in values])
+    return (b"j", "\0".join(distinct).encode("utf-8"), len(distinct),
+            _pack_codes(codes, len(distinct) + 1))
+
+
+def dumps(rows: List[dict], names: Iterable[str] = None) -> bytes:
+    """ Encode the attributes of every object, one dict per object,
+    limited to names (every key of the rows by default)
+    """
+    if names is None:
+        names = dict.fromkeys(itertools.chain.from_iterable(rows))
+    names = list(names)
+    chunks = [MAGIC, _HEADER.pack(VERSION, len(rows), len(names))]
+    for name in names:
+        kind, data, size, codes = _column(
+            list(map(dict.get, rows, itertools.repeat(name))))
+        encoded = name.encode("utf-8")
+        chunks += [_U16.pack(len(encoded)), encoded,
+                   _COLUMN.pack(kind, size, len(data)), data, codes]
+    return b"".join(chunks)
+
+
+def _table(kind: bytes, data: bytes, size: int) -> list:
+    """ Decode a column table, None first
+    """
+    if size == 0:
+        return [None]
+    if kind == b"t":
+        seconds = array("q")
+        seconds.frombytes(data)
+        if sys.byteorder != "little":
+            seconds.byteswap()
+        return [None] + [EPOCH + timedelta(seconds=s) for s in seconds]
+    values = data.decode("utf-8").split("\0")
+    if kind == b"j":
+        values = list(map(json.loads, values))
+    elif kind != b"s":
+        raise ValueError("Unknown snapshot column kind: {}".format(kind))
+    return [None] + values
+
+
+def loads(data: bytes) -> Tuple[List[str], Iterator[tuple]]:
+    """ Decode a snapshot into the attribute names, and the values of
+    every object in the same order, built as they are iterated
+    """
+    if not is_snapshot(data):
+        raise ValueError("Not a model snapshot")
+    pos = len(MAGIC)
+    version, count, n_columns = _HEADER.unpack_from(data, pos)
+    if version != VERSION:
+        raise ValueError("Unsupported snapshot version: {}".format(version))
+    pos += _HEADER.size
+    names = []
+    columns = []
+    for _ in range(n_columns):
+        (length,) = _U16.unpack_from(data, pos)
+        pos += _U16.size
+        names.append(data[pos:pos + length].decode("utf-8"))
+        pos += length
+        kind, size, table_size = _COLUMN.unpack_from(data, pos)
+        pos += _COLUMN.size
+        table = _table(kind, data[pos:pos + table_size], size)
+        pos += table_size
+        codes = array(chr(data[pos]))
+        pos += 1
+        end = pos + count * codes.itemsize
+        codes.frombytes(data[pos:end])
+        if sys.byteorder != "little":
+            codes.byteswap()
+        pos = end
+        columns.append(map(table.__getitem__, codes))
+    if not columns:
+        return names, itertools.repeat((), count)
+    return names, zip(*columns)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+""" Writer module
+Write-behind of model snapshots: mutations only mark their class
+dirty, and a background thread rewrites each dirty class at most once
+per interval, however many mutations happened in between.
+A failed write is retried at the next interval, and raised by wait()
+and stop() until the class is written again.
+"""
+from typing import TypeVar
+import threading
+
+
+class WriteBehindWriter():
+    """ Background writer coalescing dirty classes into one write each
+    """
+
+    def __init__(self, interval: float):
+        """ Initialize the writer; call start() to run it
+        """
+        self.interval = interval
+        self.last_error = None
+        self._pending = {}
+        self._marked = {}
+        self._written = {}
+        self._errors = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Start the background thread
+        """
+        self._thread = threading.Thread(target=self._run,
+                                        name="models-writer", daemon=True)
+        self._thread.start()
+
+    def mark(self, cls: TypeVar('Base')):
+        """ Mark cls as modified since its last write
+        """
+        s_class = cls.__name__
+        with self._cond:
+            self._pending[s_class] = cls
+            self._marked[s_class] = self._marked.get(s_class, 0) + 1
+
+    def pending(self) -> int:
+        """ Number of classes waiting to be written
+        """
+        with self._cond:
+            return len(self._pending)
+
+    def backlog(self, cls: TypeVar('Base')) -> int:
+        """ Number of marks of cls not written yet
+        """
+        s_class = cls.__name__
+        with self._cond:
+            return self._marked.get(s_class, 0) - \
+                self._written.get(s_class, 0)
+
+    def wait(self, cls: TypeVar('Base') = None,
+             timeout: float = None) -> bool:
+        """ Wait until what was marked so far (for cls, or for every
+        class) has been written; False if timeout expired first
+        Raises the error of the last write of a class still waited for
+        if that write failed.
+        """
+        with self._cond:
+            if cls is None:
+                targets = dict(self._marked)
+            else:
+                targets = {cls.__name__: self._marked.get(cls.__name__, 0)}
+
+            def _waiting():
+                return [s_class for s_class, generation in targets.items()
+                        if self._written.get(s_class, 0) < generation]
+
+            def _done():
+                waiting = _waiting()
+                return not waiting or any(s_class in self._errors
+                                          for s_class in waiting)
+
+            if not self._cond.wait_for(_done, timeout):
+                return False
+            for s_class in _waiting():
+                if s_class in self._errors:
+                    raise self._errors[s_class]
+            return True
+
+    def flush(self):
+        """ Write every dirty class now, in the calling thread
+        """
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        """ Write every dirty class; the caller holds the flush lock
+        """
+        with self._cond:
+            batch = [(cls, self._marked[s_class])
+                     for s_class, cls in self._pending.items()]
+            self._pending.clear()
+        for cls, generation in batch:
+            s_class = cls.__name__
+            try:
+                cls.save_to_file(fsync=True)
+            except Exception as e:
+                with self._cond:
+                    self.last_error = e
+                    self._errors[s_class] = e
+                    self._pending.setdefault(s_class, cls)
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._errors.pop(s_class, None)
+                if self._written.get(s_class, 0) < generation:
+                    self._written[s_class] = generation
+                self._cond.notify_all()
+
+    def stop(self):
+        """ Stop the background thread and write what is left
+        Raises the error of a class left unwritten.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._cond:
+            for s_class in self._pending:
+                if s_class in self._errors:
+                    raise self._errors[s_class]
+
+    def _run(self):
+        """ Flush dirty classes every interval until stopped
+        """
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -41,7 +41,7 @@ class SessionDBAuth(SessionExpAuth):
         Returns:
             str: The user ID if session_id is found in the database.
         """
-        user_id = UserSession.search({"session_id": session_id})
+        user_id = UserSession.search({"session_id": session_id}, limit=1)
         if user_id:
             return user_id
         return None
@@ -59,7 +59,8 @@ class SessionDBAuth(SessionExpAuth):
         session_id = self.session_cookie(request)
         if not session_id:
             return False
-        user_session = UserSession.search({"session_id": session_id})
+        user_session = UserSession.search({"session_id": session_id},
+                                          limit=1)
         if user_session:
             user_session[0].remove()
             return True
@@ -5,6 +5,14 @@ Module of Index views
 
 from flask import jsonify, abort
 from api.v1.views import app_views
+from models.base import MODELS
+# model classes register themselves in MODELS when imported
+from models.user import User
+from models.user_session import UserSession
+import re
+
+
+_WORD_START = re.compile(r"(?<!^)(?=[A-Z])")
 
 
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
@@ -42,9 +50,15 @@ def stats() -> str:
     """
     GET /api/v1/stats
     Return:
-      - the number of each objects
+      - the number of each objects (e.g. "users" for User), and under
+        "models" the counters of the store of each model class
+    Nothing is loaded or scanned, so monitoring can poll it often.
     """
-    from models.user import User
     stats = {}
-    stats['users'] = User.count()
+    models = {}
+    for name, model in sorted(MODELS.items()):
+        models[name] = model.stats()
+        key = "{}s".format(_WORD_START.sub("_", name).lower())
+        stats[key] = models[name]["count"]
+    stats['models'] = models
     return jsonify(stats)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Benchmark of Auth.require_auth
+usage: ./benchmark_auth.py [-p PATTERNS] [--ops OPS]
+Each query runs against PATTERNS excluded paths, a quarter of them
+ending with "*", and prints one JSON document per variant: the legacy
+loop over the excluded paths, the paths compiled once into
+ExcludedPaths (as api/v1/app.py does), and a plain list compiled on
+the fly.
+"""
+from typing import List
+import argparse
+import json
+import time
+import uuid
+from api.v1.auth.auth import Auth, ExcludedPaths
+
+
+def legacy_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ Auth.require_auth as it used to be: every excluded path tried
+    in turn
+    """
+    if path is None:
+        return True
+    elif excluded_paths is None or excluded_paths == []:
+        return True
+    elif path in excluded_paths:
+        return False
+    else:
+        for i in excluded_paths:
+            if i.startswith(path):
+                return False
+            if path.startswith(i):
+                return False
+            if i[-1] == "*":
+                if path.startswith(i[:-1]):
+                    return False
+    return True
+
+
+def make_patterns(count: int) -> List[str]:
+    """ Build count excluded paths
+    """
+    return ["/api/v1/public/{}/*".format(i) if i % 4 == 0
+            else "/api/v1/public/{}/".format(i) for i in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="require_auth benchmark")
+    parser.add_argument("-p", "--patterns", type=int, default=500,
+                        help="number of excluded paths")
+    parser.add_argument("--ops", type=int, default=20000,
+                        help="calls per query and variant")
+    args = parser.parse_args()
+    patterns = make_patterns(args.patterns)
+    compiled = ExcludedPaths(patterns)
+    auth = Auth()
+    last = args.patterns - 1
+    queries = {
+        "protected": ["/api/v1/users/me"],
+        "protected_distinct": ["/api/v1/users/{}".format(uuid.uuid4())
+                               for _ in range(args.ops)],
+        "excluded_last": ["/api/v1/public/{}/".format(last)],
+        "excluded_wildcard": ["/api/v1/public/0/assets/logo.png"],
+    }
+    variants = {
+        "legacy": lambda path: legacy_require_auth(path, patterns),
+        "compiled": lambda path: auth.require_auth(path, compiled),
+        "list": lambda path: auth.require_auth(path, patterns),
+    }
+    for name, paths in queries.items():
+        paths = (paths * args.ops)[:args.ops]
+        for variant, func in variants.items():
+            start = time.perf_counter()
+            for path in paths:
+                required = func(path)
+            seconds = (time.perf_counter() - start) / args.ops
+            print(json.dumps({"name": name, "variant": variant,
+                              "patterns": args.patterns,
+                              "microseconds": seconds * 1e6,
+                              "require_auth": required}))
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+""" Benchmarks of the model store
+usage: ./benchmark_models.py load [-n COUNT]
+       ./benchmark_models.py memory [-n COUNT]
+       ./benchmark_models.py threads [-t THREADS] [-r READERS] [--ops OPS]
+       ./benchmark_models.py bulk [-n COUNT] [--ops OPS]
+       ./benchmark_models.py search [-n COUNT] [--ops OPS]
+       ./benchmark_models.py snapshot [-n COUNT]
+Every benchmark runs in a scratch directory and prints one JSON
+document per measurement.
+"""
+from datetime import datetime
+from typing import Callable
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import models.base
+from models.base import DATA, TIMESTAMP_FORMAT
+from models.user import User
+
+
+SCRIPT = os.path.abspath(__file__)
+
+
+def make_user(i: int, now: str) -> User:
+    """ Build the i-th benchmark user
+    """
+    user = User(created_at=now, updated_at=now)
+    user.email = "user{}@example.com".format(i)
+    user.password = "pwd{}".format(i)
+    user.first_name = "First{}".format(i)
+    user.last_name = "Last{}".format(i)
+    return user
+
+
+def populate(count: int):
+    """ Write a store of count users through the regular save path
+    """
+    User.load_from_file()
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    for i in range(count):
+        user = make_user(i, now)
+        DATA["User"][user.id] = user
+    User.save_to_file()
+    DATA["User"] = {}
+
+
+def legacy_load():
+    """ load_from_file as it used to be: json.load, then strptime
+    """
+    parse = models.base.parse_timestamp
+    models.base.parse_timestamp = lambda value: datetime.strptime(
+        value, TIMESTAMP_FORMAT)
+    try:
+        DATA["User"] = {}
+        with open(".db_User.json", 'r') as f:
+            objs_json = json.load(f)
+            for obj_id, obj_json in objs_json.items():
+                DATA["User"][obj_id] = User(**obj_json)
+    finally:
+        models.base.parse_timestamp = parse
+
+
+def legacy_search(attributes: dict) -> list:
+    """ User.search as it used to be: the index of the first attribute
+    only, and only the first attribute checked
+    """
+    candidates = DATA["User"].values()
+    for k, v in attributes.items():
+        index = User._indexes().get(k)
+        if index is not None:
+            candidates = index.lookup(v)
+        break
+
+    def _search(obj):
+        if len(attributes) == 0:
+            return True
+        for k, v in attributes.items():
+            if (getattr(obj, k) != v):
+                return False
+            return True
+
+    return list(filter(_search, candidates))
+
+
+def measure(name: str, func: Callable, memory: bool = True) -> dict:
+    """ Time func, then trace its peak memory in a second run
+    """
+    start = time.perf_counter()
+    func()
+    result = {"name": name, "seconds": time.perf_counter() - start,
+              "objects": User.count()}
+    DATA["User"] = {}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        DATA["User"] = {}
+    return result
+
+
+def bench_load(args):
+    """ Startup time of User.load_from_file, before and after
+    """
+    populate(args.count)
+    size = os.path.getsize(".db_User.json")
+    for name, func in (("legacy_load", legacy_load),
+                       ("load_from_file", User.load_from_file)):
+        result = measure(name, func, not args.no_memory)
+        result["file_bytes"] = size
+        print(json.dumps(result))
+
+
+def bench_memory(args):
+    """ Bytes per stored user, dict-backed then compact (MODEL_COMPACT=1),
+    once built, after User.save_to_file(), after the first search
+    (which builds the indexes), then after serializing every user as
+    GET /api/v1/users does: what a running API holds
+    Each representation is measured in its own interpreter since the
+    mode is fixed when models.base is imported.
+    """
+    if not args.child:
+        for compact in ("0", "1"):
+            env = dict(os.environ, MODEL_COMPACT=compact)
+            subprocess.run([sys.executable, SCRIPT, "memory", "--child",
+                            "-n", str(args.count)], env=env, check=True)
+        return
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    DATA["User"] = {}
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(args.count):
+        user = make_user(i, now)
+        DATA["User"][user.id] = user
+    used = tracemalloc.get_traced_memory()[0] - before
+    User.save_to_file()
+    saved = tracemalloc.get_traced_memory()[0] - before
+    users = User.all()
+    indexed = tracemalloc.get_traced_memory()[0] - before
+    json.dumps([user.to_json(cache=False) for user in users])
+    listed = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(json.dumps({"name": "memory", "compact": models.base.COMPACT_MODELS,
+                      "users": args.count, "bytes": used,
+                      "bytes_per_user": used / args.count,
+                      "bytes_per_user_saved": saved / args.count,
+                      "bytes_per_user_indexed": indexed / args.count,
+                      "bytes_per_user_listed": listed / args.count}))
+
+
+def bench_threads(args):
+    """ Throughput of concurrent writers and readers, then a check that
+    no update was lost, in memory or on disk
+    Each writer creates --ops users then updates each of them once,
+    while the readers look users up by email and page through them in
+    a tight loop. Such CPU-bound readers hold the GIL most of the time,
+    which slows down writers doing I/O, so try -r 0 as well. Run it
+    under each MODEL_STORE_MODE to compare the persistence paths.
+    """
+    User.load_from_file()
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    done = threading.Event()
+    errors = []
+    counts = {"writes": 0, "reads": 0}
+    counts_lock = threading.Lock()
+
+    def _writer(w: int):
+        """ Create then update --ops users """
+        try:
+            users = []
+            for i in range(args.ops):
+                user = make_user(w * args.ops + i, now)
+                user.save()
+                users.append(user)
+            for user in users:
+                User.get(user.id).last_name = "Updated"
+                user.save()
+        except Exception as e:
+            errors.append(e)
+        with counts_lock:
+            counts["writes"] += 2 * args.ops
+
+    def _reader(r: int):
+        """ Search and page until the writers are done """
+        reads = 0
+        try:
+            while not done.is_set():
+                i = (r * 7919 + reads) % (args.threads * args.ops)
+                User.search({"email": "user{}@example.com".format(i)})
+                User.page(limit=10)
+                reads += 2
+        except Exception as e:
+            errors.append(e)
+        with counts_lock:
+            counts["reads"] += reads
+
+    writers = [threading.Thread(target=_writer, args=(w,))
+               for w in range(args.threads)]
+    readers = [threading.Thread(target=_reader, args=(r,))
+               for r in range(args.readers)]
+    start = time.perf_counter()
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    done.set()
+    for thread in readers:
+        thread.join()
+    User.sync()
+
+    expected = args.threads * args.ops
+    in_memory = [u for u in User.all() if u.last_name == "Updated"]
+    User.load_from_file()
+    on_disk = [u for u in User.all() if u.last_name == "Updated"]
+    print(json.dumps({
+        "name": "threads", "store_mode": models.base.STORE_MODE,
+        "threads": args.threads, "readers": args.readers,
+        "seconds": seconds,
+        "writes_per_second": counts["writes"] / seconds,
+        "reads_per_second": counts["reads"] / seconds,
+        "lost_in_memory": expected - len(in_memory),
+        "lost_on_disk": expected - len(on_disk),
+        "errors": [repr(e) for e in errors]}))
+
+
+def bench_bulk(args):
+    """ Importing users one save() at a time, measured on the first
+    --ops users and extrapolated, against one save_many() of all
+    """
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    User.load_from_file()
+    start = time.perf_counter()
+    for i in range(args.ops):
+        make_user(i, now).save()
+    seconds = time.perf_counter() - start
+    User.remove_many(User.all())
+    print(json.dumps({"name": "save_loop", "users": args.ops,
+                      "seconds": seconds,
+                      "users_per_second": args.ops / seconds}))
+
+    users = [make_user(i, now) for i in range(args.count)]
+    start = time.perf_counter()
+    User.save_many(users)
+    seconds = time.perf_counter() - start
+    User.sync()
+    User.load_from_file()
+    print(json.dumps({"name": "save_many", "users": args.count,
+                      "seconds": seconds,
+                      "users_per_second": args.count / seconds,
+                      "stored": User.count()}))
+
+
+def bench_search(args):
+    """ Latency of User.search on the file store per query shape,
+    before and after the query planner (the legacy results may be
+    wrong: it only checked the first attribute)
+    """
+    populate(args.count)
+    User.load_from_file()
+    User._indexes()
+    i = args.count // 2
+    updated_at = User.get(next(iter(DATA["User"]))).updated_at
+    queries = {
+        "email": ({"email": "user{}@example.com".format(i)}, None),
+        "name_then_email": ({"first_name": "First{}".format(i),
+                             "email": "user{}@example.com".format(i)},
+                            None),
+        "email_mismatch": ({"email": "user{}@example.com".format(i),
+                            "first_name": "nobody"}, None),
+        "unindexed": ({"last_name": "Last{}".format(i)}, None),
+        "unindexed_limit_1": ({"updated_at": updated_at}, 1),
+    }
+    for name, (attributes, limit) in queries.items():
+        for variant, func in (
+                ("legacy", lambda: legacy_search(attributes)),
+                ("search", lambda: User.search(attributes, limit))):
+            start = time.perf_counter()
+            for _ in range(args.ops):
+                found = len(func())
+            seconds = (time.perf_counter() - start) / args.ops
+            print(json.dumps({"name": name, "variant": variant,
+                              "microseconds": seconds * 1e6,
+                              "found": found}))
+
+
+def bench_snapshot(args):
+    """ Time of User.save_to_file then User.load_from_file, and size of
+    the snapshot, in each MODEL_SNAPSHOT_FORMAT, then of the conversion
+    of the binary snapshot back to JSON with a record left in the journal
+    """
+    models.base.SNAPSHOT_FORMAT = "json"
+    populate(args.count)
+    User.load_from_file()
+    for snapshot_format in ("json", "binary"):
+        models.base.SNAPSHOT_FORMAT = snapshot_format
+        start = time.perf_counter()
+        User.save_to_file()
+        save_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        User.load_from_file()
+        load_seconds = time.perf_counter() - start
+        print(json.dumps({"name": "snapshot", "format": snapshot_format,
+                          "users": User.count(),
+                          "save_seconds": save_seconds,
+                          "load_seconds": load_seconds,
+                          "file_bytes": os.path.getsize(
+                              User._snapshot_path())}))
+    os.remove(User._snapshot_path("json"))
+    user = make_user(args.count, datetime.utcnow().strftime(TIMESTAMP_FORMAT))
+    User._journal().append({"op": "save", "obj": user.to_json(True)})
+    models.base.SNAPSHOT_FORMAT = "json"
+    start = time.perf_counter()
+    User.load_from_file()
+    print(json.dumps({"name": "snapshot_convert", "format": "json",
+                      "users": User.count(),
+                      "load_seconds": time.perf_counter() - start,
+                      "journal_bytes": User._journal().file_size(),
+                      "binary_left": os.path.exists(
+                          User._snapshot_path("binary"))}))
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "memory": bench_memory,
+    "threads": bench_threads,
+    "bulk": bench_bulk,
+    "search": bench_search,
+    "snapshot": bench_snapshot,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model store benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("-n", "--count", type=int, default=100000,
+                        help="number of users")
+    parser.add_argument("-t", "--threads", type=int, default=8,
+                        help="number of writer threads")
+    parser.add_argument("-r", "--readers", type=int, default=8,
+                        help="number of reader threads")
+    parser.add_argument("--ops", type=int, default=250,
+                        help="users created by each writer thread, "
+                        "one at a time by bulk, or queries run by search")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+""" Journal module
+Append-only log of model mutations, one checksummed JSON record per
+line: "<crc32 as 8 hex digits> <json>\n". A record is only trusted
+when its line is complete and its checksum matches, so a write torn
+by a crash is detected and cut off on replay.
+Appends are group committed: records are queued in order, and the
+thread that writes them also writes whatever other threads queued in
+the meantime, with a single flush (and fsync).
+Several processes may share a journal. Appends and tail() hold a
+shared flock on the file, while replay() and whoever holds exclusive()
+(e.g. to fold the journal into a snapshot, then truncate it) hold an
+exclusive one, so the file is never truncated under a reader or a
+writer.
+"""
+from typing import Iterator
+from os import path
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import zlib
+
+
+class Journal():
+    """ Journal of one model class
+    position is the offset up to which this process has read (or
+    written) the records.
+    """
+
+    def __init__(self, file_path: str, fsync: bool = False):
+        """ Initialize a journal stored at file_path
+        """
+        self.file_path = file_path
+        self.fsync = fsync
+        self.position = 0
+        self._file = None
+        self._queue = collections.deque()
+        self._lock = threading.RLock()
+        self._held = False
+
+    def size(self) -> int:
+        """ Size of the journal in bytes
+        """
+        with self._lock:
+            if self._file is not None:
+                return self._file.tell()
+        return self.file_size()
+
+    def file_size(self) -> int:
+        """ Size of the journal file, appended to by every process
+        """
+        try:
+            return os.stat(self.file_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def pending(self) -> int:
+        """ Number of records queued and not written yet
+        """
+        return len(self._queue)
+
+    def append(self, record: dict):
+        """ Append one record and flush it to the OS
+        """
+        self.enqueue(record)
+        self.commit()
+
+    def enqueue(self, record: dict):
+        """ Queue one record, to be written by the next commit()
+        """
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        self._queue.append(b"%08x " % zlib.crc32(data) + data + b"\n")
+
+    def commit(self):
+        """ Write every queued record and flush them to the OS
+        Records queued by other threads are written along, so once this
+        returns, everything queued before the call is written. When no
+        other process appended since position, position moves past the
+        records, which then need no replay.
+        """
+        with self._lock:
+            lines = []
+            while self._queue:
+                lines.append(self._queue.popleft())
+            if len(lines) == 0:
+                return
+            data = b"".join(lines)
+            with self._flock(fcntl.LOCK_SH, create=True):
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                end = self._file.tell()
+                if end - len(data) == self.position:
+                    self.position = end
+
+    def exclusive(self):
+        """ Context holding off the appends and reads of every thread
+        and process
+        """
+        return self._flock(fcntl.LOCK_EX)
+
+    def shared(self):
+        """ Context holding off exclusive() in every thread and process
+        """
+        return self._flock(fcntl.LOCK_SH)
+
+    @contextlib.contextmanager
+    def _flock(self, operation: int, create: bool = False):
+        """ Hold the thread lock and a flock on the file; nested calls
+        keep the flock already held, and nothing is locked when the file
+        does not exist unless create
+        """
+        with self._lock:
+            if self._held or (self._file is None and not create and
+                              not path.exists(self.file_path)):
+                yield
+                return
+            if self._file is None:
+                self._file = open(self.file_path, 'ab')
+            fcntl.flock(self._file, operation)
+            self._held = True
+            try:
+                yield
+            finally:
+                self._held = False
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def replay(self) -> Iterator[dict]:
+        """ Yield every intact record, in order
+        Replay stops at the first torn or corrupt line, and the file is
+        truncated there so later appends start from a clean tail.
+        """
+        with self.exclusive():
+            self.position = 0
+            yield from self.tail()
+            if self.position < self.file_size():
+                with open(self.file_path, 'r+b') as f:
+                    f.truncate(self.position)
+
+    def tail(self) -> Iterator[dict]:
+        """ Yield the intact records after position, in order, moving
+        position past each of them
+        """
+        with self.shared():
+            if not path.exists(self.file_path):
+                return
+            with open(self.file_path, 'rb') as f:
+                f.seek(self.position)
+                for line in f:
+                    record = self._decode(line)
+                    if record is None:
+                        break
+                    self.position += len(line)
+                    yield record
+
+    @staticmethod
+    def _decode(line: bytes) -> dict:
+        """ Decode a journal line, None if it is torn or corrupt
+        """
+        if not line.endswith(b"\n") or line[8:9] != b" ":
+            return None
+        data = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(data):
+                return None
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def truncate(self):
+        """ Drop every written record, e.g. once they are in a snapshot
+        """
+        with self._flock(fcntl.LOCK_EX, create=True):
+            self._file.truncate(0)
+            self._file.seek(0)
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.position = 0
+
+    def close(self):
+        """ Close the append handle
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
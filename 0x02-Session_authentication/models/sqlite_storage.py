@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+Storage backend keeping every model class in one SQLite table:
+the JSON of each object in a "data" column, plus one indexed column
+per INDEXED_ATTRIBUTES entry so lookups on them stay in SQL. Objects
+are read from the database on demand, so the store can outgrow the
+memory and be shared by several worker processes.
+The number of rows of every table is kept in the "_counts" table by
+triggers, so counting never scans a table, whichever process writes.
+"""
+from typing import TypeVar, List, Iterator, Tuple
+from os import path
+import contextlib
+import itertools
+import json
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ SQLite storage backend
+    """
+
+    def __init__(self, file_path: str, timeout: float = 30.0):
+        """ Initialize the backend on the database file_path
+        """
+        self.file_path = file_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._tables = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the calling thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        """ Quote an SQL identifier
+        """
+        return '"{}"'.format(name.replace('"', '""'))
+
+    def _table(self, cls: TypeVar('Base')) -> str:
+        """ Quoted table of cls, created with its indexes and counting
+        triggers if needed; not to be called in a transaction
+        The row count is seeded in the same transaction as the triggers
+        are created, so that rows written meanwhile by other processes
+        are counted once.
+        """
+        s_class = cls.__name__
+        table = self._quote(s_class)
+        if s_class not in self._tables:
+            columns = "".join(", {} TEXT".format(self._quote(attr))
+                              for attr in cls.INDEXED_ATTRIBUTES)
+            name = "'{}'".format(s_class.replace("'", "''"))
+            with self._transaction("BEGIN IMMEDIATE") as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY "
+                             "KEY, data TEXT NOT NULL{})".format(table,
+                                                                 columns))
+                for attr in cls.INDEXED_ATTRIBUTES:
+                    index = self._quote("{}_{}".format(s_class, attr))
+                    conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} "
+                                 "({})".format(index, table,
+                                               self._quote(attr)))
+                conn.execute("CREATE TABLE IF NOT EXISTS _counts (name TEXT "
+                             "PRIMARY KEY, rows INTEGER NOT NULL)")
+                for event, delta in (("INSERT", "+"), ("DELETE", "-")):
+                    trigger = self._quote("{}_count_{}".format(
+                        s_class, event.lower()))
+                    conn.execute("CREATE TRIGGER IF NOT EXISTS {} AFTER {} "
+                                 "ON {} BEGIN UPDATE _counts SET rows = rows "
+                                 "{} 1 WHERE name = {}; END".format(
+                                     trigger, event, table, delta, name))
+                conn.execute("INSERT OR IGNORE INTO _counts VALUES ({}, "
+                             "(SELECT COUNT(*) FROM {}))".format(name, table))
+            self._tables.add(s_class)
+        return table
+
+    @staticmethod
+    def _load(cls: TypeVar('Base'), rows) -> Iterator[TypeVar('Base')]:
+        """ Build objects from (data,) rows
+        """
+        for (data,) in rows:
+            yield cls(**json.loads(data))
+
+    def _row(self, obj: TypeVar('Base')) -> tuple:
+        """ Column values of obj
+        """
+        return (obj.id, json.dumps(obj._json(True, False))) + tuple(
+            getattr(obj, attr, None) for attr in obj.INDEXED_ATTRIBUTES)
+
+    def _upsert(self, cls: TypeVar('Base')) -> str:
+        """ Statement inserting or updating one row of cls, keeping the
+        original position of updated rows
+        """
+        columns = ["data"] + [self._quote(attr)
+                              for attr in cls.INDEXED_ATTRIBUTES]
+        return "INSERT INTO {} (id, {}) VALUES (?, {}) ON CONFLICT(id) " \
+            "DO UPDATE SET {}".format(
+                self._table(cls), ", ".join(columns),
+                ", ".join("?" * len(columns)),
+                ", ".join("{0} = excluded.{0}".format(c) for c in columns))
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update obj, keeping its original position
+        """
+        self._connection().execute(self._upsert(type(obj)), self._row(obj))
+
+    def save_many(self, cls: TypeVar('Base'), objs: List[TypeVar('Base')]):
+        """ Insert or update objs of cls in one transaction
+        """
+        upsert = self._upsert(cls)
+        with self._transaction() as conn:
+            conn.executemany(upsert, map(self._row, objs))
+
+    def remove(self, obj: TypeVar('Base')) -> bool:
+        """ Delete obj, False if it was not stored
+        """
+        table = self._table(type(obj))
+        cursor = self._connection().execute(
+            "DELETE FROM {} WHERE id = ?".format(table), (obj.id,))
+        return cursor.rowcount > 0
+
+    def remove_many(self, cls: TypeVar('Base'),
+                    objs: List[TypeVar('Base')]) -> int:
+        """ Delete objs of cls in one transaction, and return how many
+        were stored
+        """
+        table = self._table(cls)
+        with self._transaction() as conn:
+            cursor = conn.executemany(
+                "DELETE FROM {} WHERE id = ?".format(table),
+                ((obj.id,) for obj in objs))
+        return cursor.rowcount
+
+    @contextlib.contextmanager
+    def _transaction(self, begin: str = "BEGIN") -> Iterator[
+            sqlite3.Connection]:
+        """ Run the block in a transaction of the calling thread, opened
+        by the begin statement
+        """
+        conn = self._connection()
+        conn.execute(begin)
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, cls: TypeVar('Base'), obj_id: str) -> TypeVar('Base'):
+        """ Object of cls with ID obj_id, or None
+        """
+        rows = self._connection().execute(
+            "SELECT data FROM {} WHERE id = ?".format(self._table(cls)),
+            (obj_id,))
+        for obj in self._load(cls, rows):
+            return obj
+        return None
+
+    def count(self, cls: TypeVar('Base')) -> int:
+        """ Number of objects of cls, as counted by the triggers
+        """
+        self._table(cls)
+        return self._connection().execute(
+            "SELECT rows FROM _counts WHERE name = ?",
+            (cls.__name__,)).fetchone()[0]
+
+    def stats(self, cls: TypeVar('Base')) -> dict:
+        """ Counters of cls for monitoring, with the keys of Base.stats;
+        the count is read from the row kept up to date by the triggers,
+        which also counts the writes of other processes, and the
+        write-ahead log stands for the journal
+        Writes are done by statement and indexes are kept by SQLite, so
+        there is no save time, in-memory index or pending write.
+        """
+        sizes = [path.getsize(f) if path.exists(f) else 0
+                 for f in (self.file_path, self.file_path + "-wal")]
+        return {
+            "count": self.count(cls),
+            "file_bytes": sizes[0],
+            "journal_bytes": sizes[1],
+            "last_save_seconds": None,
+            "indexes": {},
+            "pending_writes": 0,
+        }
+
+    def search(self, cls: TypeVar('Base'), attributes: dict = {},
+               limit: int = None) -> List[TypeVar('Base')]:
+        """ Objects of cls matching every attribute, up to limit
+        Indexed attributes are matched in SQL, leaving the choice of
+        index to SQLite; every attribute is then checked on the loaded
+        objects, which are only read until limit of them match.
+        """
+        where = []
+        params = []
+        for k, v in attributes.items():
+            if k not in cls.INDEXED_ATTRIBUTES:
+                continue
+            if v is None:
+                where.append("{} IS NULL".format(self._quote(k)))
+            elif isinstance(v, (str, int, float)):
+                where.append("{} = ?".format(self._quote(k)))
+                params.append(v)
+        sql = "SELECT data FROM {}".format(self._table(cls))
+        if len(where) > 0:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._connection().execute(sql + " ORDER BY rowid", params)
+        objs = (obj for obj in self._load(cls, rows)
+                if all(getattr(obj, k) == v for k, v in attributes.items()))
+        return list(itertools.islice(objs, limit))
+
+    def page(self, cls: TypeVar('Base'), cursor: str = None,
+             limit: int = None) -> Tuple[List[TypeVar('Base')], str]:
+        """ Up to limit objects of cls ordered by ID after cursor, and
+        the cursor of the next page
+        """
+        sql = "SELECT data FROM {}".format(self._table(cls))
+        params = []
+        if cursor is not None:
+            sql += " WHERE id > ?"
+            params.append(cursor)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        objs = list(self._load(cls, self._connection().execute(sql, params)))
+        if limit is not None and len(objs) > limit:
+            objs = objs[:limit]
+            return objs, objs[-1].id
+        return objs, None
+
+    def load(self, cls: TypeVar('Base'), snapshot_path: str):
+        """ Create the table of cls; when it is empty, import the
+        snapshot snapshot_path of the file store (JSON or binary) if
+        there is one
+        """
+        self._table(cls)
+        if not path.exists(snapshot_path) or self.count(cls) > 0:
+            return
+        with self._transaction():
+            with open(snapshot_path, 'rb') as f:
+                for _, obj in cls._read_snapshot(f):
+                    self.save(obj)
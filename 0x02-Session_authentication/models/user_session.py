@@ -3,7 +3,7 @@
 define the UserSession class, which inherits from the Base class.
 """
 
-from models.base import Base
+from models.base import Base, COMPACT_MODELS
 
 
 class UserSession(Base):
@@ -14,6 +14,10 @@ class UserSession(Base):
         session_id (str): Unique identifier for the session.
     """
 
+    INDEXED_ATTRIBUTES = ("session_id",)
+    if COMPACT_MODELS:
+        __slots__ = ("user_id", "session_id")
+
     def __init__(self, *args: list, **kwargs: dict):
         """
         initialize a new UserSession instance.